@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Compare the JSON and binary context formats.
+
+Saves a 500-message history (the context cap) in each format and reports the
+file size, then the best-of-N wall time and peak memory of what a contextual
+query does with it: load the context, read the last MAX_DIALOG_REQUEST_SIZE
+messages and save it back with one more exchange.
+
+    $ python benchmarks/bench_context.py
+"""
+import json
+import os
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import MAX_DIALOG_REQUEST_SIZE, MAX_HISTORY_MESSAGE_COUNT  # noqa: E402
+import services.context_store as context_store  # noqa: E402
+from services.context_store import store_read, store_write  # noqa: E402
+
+REPEAT = 5
+
+ANSWER = (
+    "Here is how to do it:\n\n```python\n"
+    + "".join(f"def step_{i}(x):\n    return x * {i} + 1\n\n" for i in range(40))
+    + "```\n\nEach step is independent, so they can be called in any order.\n"
+)
+HISTORY = [
+    {"role": "user", "content": f"question {i}: how do I do thing {i}?"}
+    if i % 2 == 0
+    else {"role": "assistant", "content": ANSWER}
+    for i in range(MAX_HISTORY_MESSAGE_COUNT)
+]
+EXCHANGE = [
+    {"role": "user", "content": "one more question"},
+    {"role": "assistant", "content": ANSWER},
+]
+
+
+def json_roundtrip(path: str) -> None:
+    with open(path, "r") as f:
+        dialog = json.load(f)
+    for message in dialog[-MAX_DIALOG_REQUEST_SIZE:]:
+        message["content"]
+    with open(path, "w") as f:
+        json.dump((dialog + EXCHANGE)[-MAX_HISTORY_MESSAGE_COUNT:], f)
+
+
+def binary_roundtrip(path: str) -> None:
+    dialog = store_read(path)
+    for message in dialog[-MAX_DIALOG_REQUEST_SIZE:]:
+        message["content"]
+    store_write(path, (dialog + EXCHANGE)[-MAX_HISTORY_MESSAGE_COUNT:])
+
+
+def bench(label: str, path: str, func) -> None:
+    size = os.path.getsize(path)
+    best = min(timeit.repeat(lambda: func(path), number=1, repeat=REPEAT))
+    tracemalloc.start()
+    func(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{label:<20} {size / 1024:>9.1f} KiB {best * 1000:>9.2f} ms"
+        f" {peak / 1024:>9.1f} KiB peak"
+    )
+
+
+def main():
+    compressions = ["", "zlib"] + (["zstd"] if context_store.zstandard else [])
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "context.json")
+        with open(path, "w") as f:
+            json.dump(HISTORY, f)
+        bench("json", path, json_roundtrip)
+
+        for compression in compressions:
+            path = os.path.join(folder, f"context-{compression or 'none'}.ctx")
+            store_write(path, HISTORY, compression)
+            bench(f"binary ({compression or 'none'})", path, binary_roundtrip)
+
+
+if __name__ == "__main__":
+    main()
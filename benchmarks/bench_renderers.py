@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Compare the renderers against the original DefaultFormatter path.
+
+Renders a long answer and a 500-message history (the context cap) with each
+renderer, writes it to a line-buffered /dev/null (like a terminal) and prints the
+best-of-N wall time. The "legacy" history case mirrors the original
+dialog_print: two termcolor prints per message.
+
+    $ TERM=xterm-256color python benchmarks/bench_renderers.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import DEFAULT_PYGMENTS_STYLE, MAX_HISTORY_MESSAGE_COUNT  # noqa: E402
+from services.formatters.default import DefaultFormatter  # noqa: E402
+from services.renderers.renderer import get_renderer  # noqa: E402
+
+REPEAT = 5
+
+PROSE = """## Overview
+
+The **quick** brown fox jumps over the lazy dog, then calls `jump()` again
+and again until the dog finally wakes up and decides to do something about it.
+
+- first item, which is long enough that it will need to be wrapped at least once
+- second item with `inline code`
+1. numbered item
+
+> a quote that goes on and on for a while so that it also needs wrapping here
+"""
+
+CODE = """```python
+def fib(n):
+    a, b = 0, 1
+    for _ in range(n):
+        a, b = b, a + b
+    return a
+```
+"""
+
+LONG_ANSWER = (PROSE + CODE) * 20
+HISTORY = [
+    {"role": "user" if i % 2 == 0 else "assistant", "content": PROSE}
+    for i in range(MAX_HISTORY_MESSAGE_COUNT)
+]
+
+
+def colored(text: str, color: str) -> str:
+    try:
+        from termcolor import colored as termcolor_colored
+
+        return termcolor_colored(text, color)
+    except ImportError:
+        return f"\x1b[37m{text}\x1b[0m"
+
+
+def legacy_dialog_print(dialog: list[dict], out) -> None:
+    for message in dialog:
+        print(colored(message["role"], "green"), end=": ", file=out)
+        print(colored(message["content"], "light_grey"), end="\n", file=out)
+
+
+def bench(label: str, func) -> None:
+    best = min(timeit.repeat(func, number=1, repeat=REPEAT))
+    print(f"{label:<40} {best * 1000:>9.1f} ms")
+
+
+def main():
+    style = DEFAULT_PYGMENTS_STYLE
+    formatter = DefaultFormatter()
+    out = open(os.devnull, "w", buffering=1)
+
+    bench(
+        "long answer: DefaultFormatter",
+        lambda: print(
+            formatter.format(LONG_ANSWER, enable_color=True, style=style), file=out
+        ),
+    )
+    bench("history: legacy dialog_print", lambda: legacy_dialog_print(HISTORY, out))
+    for name in ("pygments", "ansi", "plain"):
+        renderer = get_renderer(name, enable_color=True, style=style, width=80)
+        bench(
+            f"long answer: {name}",
+            lambda: out.write(renderer.render(LONG_ANSWER) + "\n"),
+        )
+        bench(
+            f"history: {name}",
+            lambda: out.write(renderer.render_dialog(HISTORY) + "\n"),
+        )
+    out.close()
+
+
+if __name__ == "__main__":
+    main()
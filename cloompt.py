@@ -4,37 +4,52 @@ import random
 import sys
 import logging
 import readline  # noqa
+from concurrent.futures import ThreadPoolExecutor
 
 from config import (
     OPENAI_DEFAULT_MODEL,
     DEFAULT_PYGMENTS_STYLE,
+    DEFAULT_RENDERER,
+    RENDERERS,
+    DEFAULT_CONTEXT_FORMAT,
+    CONTEXT_FORMATS,
     LOGLEVEL,
     LOGLEVEL_LIB,
     HELP_ADDENDUM,
     OPENAI_MAX_TOKENS,
+    STAGE_MAX_WORKERS,
 )
 from services.context import (
+    cached_token_count,
     context_prune_all,
     context_reset,
+    context_convert_all,
     context_load,
     context_save,
     dialog_print,
     token_count,
+    token_encoder_warmup,
 )
-from services.editor import edit_string
+from services.editor import draft_edit, edit_string
 from services.formatters.code import CodeFormatter
-from services.formatters.default import DefaultFormatter
 from services.formatters.formatter import display_style_grid
+from services.index import index_refresh
+from services.harness import template_test
 from services.llm import query_chatgpt
-from services.output import info, error, exception, warning
-from services.proompt import (
-    get_system_prompt,
-    get_user_postfix_prompt,
-    get_user_prefix_prompt,
-    get_prompt_override,
-)
+from services.output import echo, info, error, exception, warning
+from services.pipeline import CodeBlockPipeline
+from services.proompt import apply_prompt_affixes, get_prompts
+from services.ratelimit import rate_limit_stats_print
+from services.renderers.renderer import get_renderer
+from services.term import get_terminal_width
+from services.usage import usage_print
 from utils.decorators import cli_error_handler, require_openai_api_key
-from utils.errors import PromptNotProvidedError, PromptTooLongError
+from utils.errors import (
+    CodeValidationError,
+    PromptNotProvidedError,
+    PromptTooLongError,
+    TemplateTestError,
+)
 
 import click
 
@@ -47,6 +62,13 @@ logging.getLogger("openai").setLevel(LOGLEVEL_LIB)
 @click.command()
 @click.option("-h", "--help", "help_", is_flag=True, help="Show this help.")
 @click.option("-e", "--editor", is_flag=True, help="Open $EDITOR to edit prompt.")
+@click.option(
+    "--loop",
+    is_flag=True,
+    help="Editor loop: re-open the session draft in $EDITOR after each response,"
+    " with the response appended as comments. Each edit replaces the previous"
+    " prompt and response. (Implies --editor)",
+)
 @click.option(
     "-i",
     "--interactive",
@@ -67,10 +89,19 @@ logging.getLogger("openai").setLevel(LOGLEVEL_LIB)
     help="Temperature (defaults to 1.0).",
 )
 @click.option("--list-styles", is_flag=True, help="List available pygments styles.")
+@click.option("--list-templates", is_flag=True, help="List available templates.")
+@click.option("--list-models", is_flag=True, help="List known models.")
 @click.option("--no-color", "no_color", is_flag=True, help="Disable color output.")
 @click.option(
     "--style", default=DEFAULT_PYGMENTS_STYLE, help="Pygments syntax-highlight style."
 )
+@click.option(
+    "--renderer",
+    "renderer_name",
+    default=DEFAULT_RENDERER,
+    type=click.Choice(RENDERERS),
+    help=f"Output renderer (defaults to '{DEFAULT_RENDERER}').",
+)
 @click.option(
     "-c", "--contextual", is_flag=True, help="Maintain context for conversation."
 )
@@ -89,6 +120,31 @@ logging.getLogger("openai").setLevel(LOGLEVEL_LIB)
     required=False,
     help="Show context history. Use `--history json` to show as json.",
 )
+@click.option(
+    "--rate-stats",
+    "rate_stats",
+    is_flag=True,
+    help="Show rate limit queueing stats (shared by all cloompt processes).",
+)
+@click.option(
+    "--usage",
+    "show_usage",
+    is_flag=True,
+    help="Show token usage and cost by day, model and template.",
+)
+@click.option(
+    "--context-format",
+    "context_format",
+    default=DEFAULT_CONTEXT_FORMAT,
+    type=click.Choice(CONTEXT_FORMATS),
+    help=f"Context file format (defaults to '{DEFAULT_CONTEXT_FORMAT}').",
+)
+@click.option(
+    "--convert-context",
+    "convert_context",
+    is_flag=True,
+    help="Convert all saved contexts to --context-format.",
+)
 @click.option(
     "--reset", "--reset-context", "reset_context", is_flag=True, help="Reset context."
 )
@@ -144,21 +200,57 @@ logging.getLogger("openai").setLevel(LOGLEVEL_LIB)
     is_flag=True,
     help="code formatter- strips non-code from output when possible",
 )
+@click.option(
+    "-o",
+    "--out-dir",
+    "out_dir",
+    default="",
+    required=False,
+    help="<path> Stream each code block in the response to a file in this folder.",
+)
+@click.option(
+    "--validate",
+    "validators",
+    multiple=True,
+    help="[<ext|lang>:]<command> Validate each code block written to --out-dir,"
+    " e.g. 'py:python -m py_compile {path}' (may be repeated).",
+)
+@click.option(
+    "--test-templates",
+    "test_templates",
+    default="",
+    required=False,
+    help="<path> Check all proompt templates and run the test cases in this folder"
+    " against recorded responses.",
+)
+@click.option(
+    "--record",
+    is_flag=True,
+    help="With --test-templates, call the API and re-record responses.",
+)
 @click.argument("prompt", required=False, default="")
 @cli_error_handler
 @require_openai_api_key
 def lm(
     help_,
     editor,
+    loop,
     interactive,
     model,
     temperature,
     list_styles,
+    list_templates,
+    list_models,
     no_color,
     style,
+    renderer_name,
     contextual,
     no_context,
     history,
+    rate_stats,
+    show_usage,
+    context_format,
+    convert_context,
     reset_context,
     prompt_template,
     no_prompt_template,
@@ -166,6 +258,10 @@ def lm(
     prefix_prompt_override,
     postfix_prompt_override,
     fmt_code,
+    out_dir,
+    validators,
+    test_templates,
+    record,
     prompt,
 ):
     """cloompt - the cli proompter"""
@@ -173,15 +269,58 @@ def lm(
     prompt_template = prompt_template.strip() if not no_prompt_template else ""
     style = style or DEFAULT_PYGMENTS_STYLE
     no_color = no_color if sys.stdout.isatty() else True
+    width = get_terminal_width() if sys.stdout.isatty() else 0
+    editor = editor or loop
     contextual = (contextual and not no_context) or interactive
     temperature = float(temperature)
     history = history.lower() if history else None
     dialog = []
-
-    # maintenance 1 in 10 runs (randomly)
+    last_prompt, last_response = "", ""
+    # True while the dialog ends with the editor loop's previous exchange
+    loop_exchange = False
+
+    info_only = (
+        reset_context
+        or list_styles
+        or list_templates
+        or list_models
+        or help_
+        or history
+        or rate_stats
+        or show_usage
+        or convert_context
+        or test_templates
+    )
+
+    # maintenance 1 in 10 runs (randomly), before anything reads or writes context
     if random.randint(1, 10) == 1:
         context_prune_all()
 
+    # Independent startup stages run in worker threads while stdin is read.
+    # Their results are collected with .result(), which re-raises any error
+    # here so cli_error_handler still sees it.
+    stages = ThreadPoolExecutor(max_workers=STAGE_MAX_WORKERS)
+
+    # keep the completion/--list-* index current (rebuilds only what changed)
+    index_future = stages.submit(
+        index_refresh, command=click.get_current_context().command
+    )
+
+    # (--reset and --convert-context change the context, so it's loaded afterwards)
+    context_future = None
+    if (contextual or history) and not (reset_context or convert_context):
+        context_future = stages.submit(context_load)
+    prompts_future = None
+    if prompt or not info_only:
+        prompts_future = stages.submit(
+            get_prompts,
+            prompt_template,
+            system_prompt_override,
+            prefix_prompt_override,
+            postfix_prompt_override,
+        )
+        stages.submit(token_encoder_warmup, model)
+
     # attempt to read prompt from piped stdin if no prompt is provided as an arg
     if not prompt and not sys.stdin.isatty():
         prompt = sys.stdin.read()
@@ -193,28 +332,53 @@ def lm(
 
     # style help - list available styles in column format
     if list_styles:
-        display_style_grid()
+        display_style_grid(index_future.result()["styles"]["items"])
+
+    # list templates / models
+    if list_templates:
+        echo("\n".join(index_future.result()["templates"]["items"]))
+    if list_models:
+        echo("\n".join(index_future.result()["models"]["items"]))
 
     # show context history
     if history:
         dialog_print(
-            context_load(),
+            context_future.result() if context_future else context_load(),
             as_json=(history == "json"),
             enable_color=not no_color,
             style=style,
+            renderer=renderer_name,
+            width=width,
         )
 
+    # show rate limit queueing stats
+    if rate_stats:
+        rate_limit_stats_print()
+
+    # show usage ledger aggregates
+    if show_usage:
+        usage_print()
+
+    # test proompt templates against recorded fixtures
+    if test_templates and not template_test(test_templates, record=record):
+        raise TemplateTestError()
+
+    # convert saved contexts to the requested format
+    if convert_context:
+        converted = context_convert_all(context_format)
+        info(f"Converted {converted} context(s) to {context_format}.")
+
     # reset context if requested and in contextual mode
     if reset_context:
         info("Context reset." if context_reset() else "No context to reset.")
 
     # exit if no prompt is provided and one of reset, list_styles, or help specified
-    if not prompt and (reset_context or list_styles or help_ or history):
+    if not prompt and info_only:
         sys.exit(0)
 
     # invoke editor
     if editor:
-        prompt = edit_string(prompt)
+        prompt = draft_edit(prompt) if loop else edit_string(prompt)
 
     # raise error if no prompt is provided via stdin or argument
     if not prompt and not interactive:
@@ -222,21 +386,20 @@ def lm(
 
     # Load the context if one exists
     if contextual:
-        dialog.extend(context_load())
-
-    # Load the prompt templates (proompts)
-    user_prefix_prompt = get_user_prefix_prompt(prompt_template)
-    user_postfix_prompt = get_user_postfix_prompt(prompt_template)
-    system_prompt = get_system_prompt(prompt_template)
-
-    # Load the proompt overrides (system, prefix, postfix prompts)
-    # Load from file if these are valid paths, otherwise treat as strings.
-    if system_prompt_override:
-        system_prompt = get_prompt_override(system_prompt_override).strip()
-    if prefix_prompt_override:
-        user_prefix_prompt = get_prompt_override(prefix_prompt_override).strip()
-    if postfix_prompt_override:
-        user_postfix_prompt = get_prompt_override(postfix_prompt_override).strip()
+        dialog.extend(context_future.result() if context_future else context_load())
+
+    # Load the prompt templates (proompts) and overrides
+    if prompts_future is None:
+        prompts_future = stages.submit(
+            get_prompts,
+            prompt_template,
+            system_prompt_override,
+            prefix_prompt_override,
+            postfix_prompt_override,
+        )
+    system_prompt, user_prefix_prompt, user_postfix_prompt = prompts_future.result()
+
+    renderer = get_renderer(renderer_name, not no_color, style, width)
 
     # Add system prompt to the dialog
     if system_prompt:
@@ -254,52 +417,89 @@ def lm(
                 if prompt.lower() in ("exit", "quit", "stop", "q", "x", ":q", ":q!"):
                     break
 
+            # editor loop: re-open the draft; stop once it's emptied or left as-is
+            if loop and not prompt:
+                prompt = draft_edit(response=last_response)
+                last_response = ""
+                if not prompt or prompt == last_prompt:
+                    break
+                # the draft is the whole revised prompt: it supersedes the last one
+                if loop_exchange:
+                    del dialog[-2:]
+                    loop_exchange = False
+
             # Apply the prompt prefix/postfix
-            modified_prompt = prompt
-            if user_prefix_prompt:
-                modified_prompt = user_prefix_prompt + "\n\n" + prompt
-            if user_postfix_prompt:
-                modified_prompt += "\n\n" + user_postfix_prompt
+            modified_prompt = apply_prompt_affixes(
+                prompt, user_prefix_prompt, user_postfix_prompt
+            )
 
             # ensure the prompt <= OPENAI_MAX_TOKENS
-            t_count = token_count(modified_prompt, model_name=model)
+            # (prefix/postfix counts are cached, only the user's text is encoded)
+            t_count = token_count(prompt, model_name=model)
+            if user_prefix_prompt:
+                t_count += cached_token_count(user_prefix_prompt + "\n\n", model)
+            if user_postfix_prompt:
+                t_count += cached_token_count("\n\n" + user_postfix_prompt, model)
             if t_count > OPENAI_MAX_TOKENS:
-                if not interactive:
+                if not (interactive or loop):
                     raise PromptTooLongError()
                 else:
                     warning(f"Prompt too long ({t_count} tokens > {OPENAI_MAX_TOKENS})")
+                    prompt = ""
                     continue
 
-            # query chatgpt
-            response_content_raw = query_chatgpt(
-                modified_prompt, dialog, model=model, temperature=temperature
-            )
+            # query chatgpt, streaming code blocks to files if requested
+            pipeline = CodeBlockPipeline(out_dir, validators) if out_dir else None
+            try:
+                response_content_raw = query_chatgpt(
+                    modified_prompt,
+                    dialog,
+                    model=model,
+                    temperature=temperature,
+                    template=prompt_template,
+                    on_chunk=pipeline.feed if pipeline else None,
+                    prompt_tokens=t_count,
+                )
+            except BaseException:
+                if pipeline:
+                    pipeline.abort()
+                raise
+            validated = pipeline.close() if pipeline else True
 
             # Add the (unmodified) prompt and response to the dialog
             dialog.append({"role": "user", "content": prompt})
             dialog.append({"role": "assistant", "content": response_content_raw})
+            last_prompt, last_response = prompt, response_content_raw
+            loop_exchange = loop
 
-            # save the context
+            # save the context (alongside formatting and printing the response)
+            save_future = None
             if contextual:
-                context_save(dialog)
+                save_future = stages.submit(context_save, list(dialog), context_format)
 
             # format the response
             if fmt_code:
-                formatter = CodeFormatter
+                response_content_raw = CodeFormatter().format(
+                    content=response_content_raw, enable_color=not no_color, style=style
+                )
             else:
-                formatter = DefaultFormatter
-            response_content_raw = formatter().format(
-                content=response_content_raw, enable_color=not no_color, style=style
-            )
+                response_content_raw = renderer.render(response_content_raw)
 
             # print the response
-            print(response_content_raw)
+            echo(response_content_raw)
+
+            if save_future:
+                save_future.result()
 
             # exit if not interactive
-            if not interactive:
+            if not (interactive or loop):
+                if not validated:
+                    raise CodeValidationError()
                 break
+            if not validated:
+                warning("Code validation failed.")
         except Exception as e:
-            if not interactive:
+            if not (interactive or loop):
                 raise
             exception(e)
             error(e)
@@ -308,6 +508,8 @@ def lm(
         # clear prompt
         prompt = ""
 
+    stages.shutdown()
+
 
 if __name__ == "__main__":
     # read additional options from env, prepend to cargs
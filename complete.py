@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+Shell completion entry point.
+
+Serves metadata from the precomputed index (see services.index) without starting
+the CLI, so completions come back in a few tens of milliseconds:
+
+    $ complete.py templates|styles|models     one item per line
+    $ complete.py fish [command]               fish completion script
+
+Generated fish scripts run complete.py from where it is, with the interpreter
+that generated them, so generate them from your own checkout (they aren't
+shipped).
+
+Only the template and model lists are rebuilt here (they're cheap); styles and
+options are refreshed by cloompt itself whenever it runs.
+"""
+import os
+import sys
+
+from services.index import fish_completions, index_load, index_refresh
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# fish functions that wrap `lm` (see config/fish/functions/) share its completions
+FISH_WRAPPERS = ("lmc", "gcm")
+
+
+def main(args: list[str]) -> int:
+    if not args:
+        sys.stderr.write(__doc__)
+        return 1
+    section = args[0]
+
+    if section == "fish":
+        command = args[1] if len(args) > 1 else "lm"
+        if command in FISH_WRAPPERS:
+            sys.stdout.write(f"complete -c {command} -w lm\n")
+            return 0
+        # the options section needs the click command (a one-off, slow import)
+        from cloompt import lm
+
+        options = index_refresh(("options",), lm)["options"]["items"]
+        complete_command = (
+            f'"{sys.executable}" "{os.path.join(ROOT, "complete.py")}"'
+        )
+        sys.stdout.write(fish_completions(options, command, complete_command))
+        return 0
+
+    index = index_load()
+    if section in ("templates", "models"):
+        index = index_refresh((section,), index=index)
+    items = index.get(section, {}).get("items", [])
+    sys.stdout.write("".join(f"{item}\n" for item in items))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
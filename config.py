@@ -13,9 +13,55 @@ OPENAI_MAX_TOKENS = 4096
 MAX_HISTORY_MESSAGE_COUNT = 500
 MAX_DIALOG_REQUEST_SIZE = 20
 PRUNE_CONTEXT_AFTER_DAYS = 10
+CONTEXT_COMPRESSION = "zlib"  # binary context format only: "zlib", "zstd" or ""
+CONTEXT_COMPRESS_MIN_BYTES = 512
+
+# Rate limiting (shared by all cloompt processes on this machine)
+# model: (requests per minute, tokens per minute)
+OPENAI_RATE_LIMITS = {
+    "gpt-3.5-turbo": (3500, 90000),
+    "gpt-3.5-turbo-16k": (3500, 180000),
+    "gpt-4": (200, 40000),
+    "gpt-4-32k": (200, 80000),
+}
+OPENAI_DEFAULT_RATE_LIMIT = (3500, 90000)
+OPENAI_RESERVED_COMPLETION_TOKENS = 1024
+RATE_LIMIT_ENABLED = True
+RATE_LIMIT_POLL_INTERVAL = 0.25
+RATE_LIMIT_QUEUE_TIMEOUT = 300
+
+# Usage ledger
+# model: (USD per 1K prompt tokens, USD per 1K completion tokens)
+OPENAI_PRICING = {
+    "gpt-3.5-turbo": (0.0015, 0.002),
+    "gpt-3.5-turbo-16k": (0.003, 0.004),
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-32k": (0.06, 0.12),
+}
+USAGE_LEDGER_MAX_BYTES = 10 * 1024 * 1024
+USAGE_LEDGER_BACKUP_COUNT = 20
+
+# Code block output pipeline (--out-dir)
+PIPELINE_MAX_WORKERS = 4
+PIPELINE_VALIDATOR_TIMEOUT = 60
+
+# Persistent cache (rendered proompts, token counts, detected shell)
+CACHE_MAX_ENTRIES = 256
+
+# Template test harness (--test-templates)
+HARNESS_MAX_WORKERS = 8
+# template params used while testing, so recordings don't depend on the machine
+HARNESS_TEMPLATE_PARAMS = {"platform": "Linux", "shell": "bash"}
+
+# Startup/shutdown stages run alongside reading stdin and printing output
+STAGE_MAX_WORKERS = 4
 
 # CLI/ENV Configurable
 DEFAULT_PYGMENTS_STYLE = "monokai"
+DEFAULT_RENDERER = "ansi"
+DEFAULT_CONTEXT_FORMAT = "json"
+CONTEXT_FORMATS = ("json", "binary")
+RENDERERS = ("ansi", "plain", "pygments")
 OPENAI_DEFAULT_MODEL = "gpt-3.5-turbo"
 DEFAULT_EDITOR = "vi"
 
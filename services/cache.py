@@ -0,0 +1,70 @@
+import json
+import os
+import threading
+from typing import Any, Optional
+
+from config import APP_NAME, CACHE_MAX_ENTRIES
+from services.output import debug
+
+"""
+Small persistent key/value cache, shared between runs.
+
+Values live in namespaces (e.g. rendered templates, token counts, detected
+shells) in a single JSON file which is read once per process. Each namespace
+keeps at most CACHE_MAX_ENTRIES entries; the oldest are evicted first.
+"""
+
+cache_folder = os.path.join(os.path.expanduser("~"), ".config", APP_NAME, "cache")
+cache_file = os.path.join(cache_folder, "cache.json")
+
+_cache: Optional[dict] = None
+_lock = threading.RLock()
+
+
+def _load() -> dict:
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = {}
+            if os.path.exists(cache_file):
+                try:
+                    with open(cache_file, "r") as f:
+                        _cache = json.load(f)
+                except (OSError, ValueError):
+                    debug(f"Discarding unreadable cache {cache_file}")
+        return _cache
+
+
+def cache_get(namespace: str, key: str) -> Any:
+    """
+    Return a cached value.
+    :param namespace: (str) cache namespace
+    :param key: (str) key within the namespace
+    :return: cached value or None
+    """
+    return _load().get(namespace, {}).get(key)
+
+
+def cache_set(namespace: str, key: str, value: Any) -> None:
+    """
+    Store a value and write the cache back to disk.
+    :param namespace: (str) cache namespace
+    :param key: (str) key within the namespace
+    :param value: JSON-serializable value
+    :return: None
+    """
+    with _lock:
+        entries = _load().setdefault(namespace, {})
+        entries.pop(key, None)
+        entries[key] = value
+        while len(entries) > CACHE_MAX_ENTRIES:
+            del entries[next(iter(entries))]
+
+        try:
+            os.makedirs(cache_folder, exist_ok=True)
+            tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+            with open(tmp_file, "w") as f:
+                json.dump(_cache, f)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            debug(f"Unable to write cache {cache_file}: {e}")
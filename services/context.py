@@ -1,11 +1,12 @@
+import hashlib
 import json
 import os
 import time
+from typing import Optional
 
 import psutil
 from pygments import highlight
 from pygments.lexers import get_lexer_by_name
-from termcolor import cprint
 import tiktoken
 
 import config
@@ -15,13 +16,19 @@ from config import (
     OPENAI_DEFAULT_MODEL,
     MAX_HISTORY_MESSAGE_COUNT,
 )
+from services.cache import cache_get, cache_set
+from services.context_store import store_read, store_write
+from services.editor import draft_folder
 from services.formatters.formatter import Formatter
-from services.output import debug
+from services.output import debug, echo
+from services.renderers.renderer import get_renderer
 
 
 parent_pid = os.getppid()
 context_folder = os.path.join(os.path.expanduser("~"), ".config", APP_NAME, "context")
 context_file = os.path.join(context_folder, f"{parent_pid}.json")
+context_binary_file = os.path.join(context_folder, f"{parent_pid}.ctx")
+context_files = {"json": context_file, "binary": context_binary_file}
 
 
 def dialog_print(
@@ -29,33 +36,18 @@ def dialog_print(
     as_json: bool = False,
     enable_color: bool = False,
     style: str = config.DEFAULT_PYGMENTS_STYLE,
+    renderer: str = config.DEFAULT_RENDERER,
+    width: int = 0,
 ) -> None:
     if as_json:
-        raw_json = json.dumps(dialog, indent=4)
+        raw_json = json.dumps([dict(message) for message in dialog], indent=4)
         if not enable_color:
-            print(raw_json)
+            echo(raw_json)
         else:
             formatter = Formatter.get_pygments_formatter(style)
-            print(highlight(raw_json, get_lexer_by_name("json"), formatter))
+            echo(highlight(raw_json, get_lexer_by_name("json"), formatter))
     else:
-        for message in dialog:
-            role = message.get("role")
-            content = message.get("content")
-            if enable_color:
-                cprint(
-                    role,
-                    "white"
-                    if role == "user"
-                    else "green"
-                    if "assistant"
-                    else "red"
-                    if "system"
-                    else "yellow",
-                    end=": ",
-                )
-                cprint(content, "light_grey", end="\n")
-            else:
-                print(f"{role}: {content}")
+        echo(get_renderer(renderer, enable_color, style, width).render_dialog(dialog))
 
 
 def token_count(prompt: str, model_name: str = OPENAI_DEFAULT_MODEL) -> int:
@@ -63,36 +55,101 @@ def token_count(prompt: str, model_name: str = OPENAI_DEFAULT_MODEL) -> int:
     return len(enc.encode(prompt))
 
 
-def dialog_token_count(dialog: list[dict], model_name: str = OPENAI_DEFAULT_MODEL):
-    dialog_json = json.dumps(dialog)
-    t_count = 0
-    for message in dialog:
-        content = message.get("content")
-        role = message.get("role")
-        # Just counting the message length seems to be off, so we tack on
-        # roles and brace count (which is still wrong, but closer- I think)
-        t_count += token_count(content, model_name=model_name)
-        t_count += token_count(role, model_name=model_name)
-    t_count += dialog_json.count("{")
-    t_count += dialog_json.count("}")
+def token_encoder_warmup(model_name: str = OPENAI_DEFAULT_MODEL) -> None:
+    """
+    Load the model's token encoding ahead of time (tiktoken loads it lazily).
+    :param model_name: (str) model whose encoding to load
+    :return: None
+    """
+    tiktoken.encoding_for_model(model_name)
+
+
+def cached_token_count(prompt: str, model_name: str = OPENAI_DEFAULT_MODEL) -> int:
+    """
+    Token count for text that rarely changes (rendered proompts), cached across runs.
+    :param prompt: (str) text to count
+    :param model_name: (str) model whose encoding to use
+    :return: (int) token count
+    """
+    key = f"{model_name}:{hashlib.sha1(prompt.encode()).hexdigest()}"
+    t_count = cache_get("tokens", key)
+    if t_count is None:
+        t_count = token_count(prompt, model_name=model_name)
+        cache_set("tokens", key, t_count)
     return t_count
 
 
+def message_token_count(
+    message: dict,
+    model_name: str = OPENAI_DEFAULT_MODEL,
+    content_tokens: Optional[int] = None,
+) -> int:
+    """
+    Approximate token count of a single dialog message.
+    :param message: (dict) message with role and content
+    :param model_name: (str) model whose encoding to use
+    :param content_tokens: (int) token count of the content, if already known
+    :return: (int) token count
+    """
+    content = message.get("content")
+    role = message.get("role")
+    if content_tokens is None:
+        if role == "system":
+            content_tokens = cached_token_count(content, model_name=model_name)
+        else:
+            content_tokens = token_count(content, model_name=model_name)
+    # Just counting the message length seems to be off, so we tack on
+    # roles and brace count (which is still wrong, but closer- I think)
+    return (
+        content_tokens
+        + token_count(role, model_name=model_name)
+        + 2
+        + content.count("{")
+        + content.count("}")
+    )
+
+
+def dialog_token_count(dialog: list[dict], model_name: str = OPENAI_DEFAULT_MODEL):
+    return sum(message_token_count(message, model_name) for message in dialog)
+
+
 def context_reset() -> bool:
-    if os.path.exists(context_file):
-        os.remove(context_file)
-        return True
-    return False
+    reset = False
+    for path in context_files.values():
+        if os.path.exists(path):
+            os.remove(path)
+            reset = True
+    return reset
+
+
+def _context_read(path: str) -> list:
+    if path.endswith(".ctx"):
+        return store_read(path)
+    with open(path, "r") as f:
+        return json.load(f)
 
 
 def context_load() -> list:
-    if os.path.exists(context_file):
-        with open(context_file, "r") as f:
-            return json.load(f)
-    return []
+    """
+    Load the session's context, in whichever format it was saved.
+    Binary contexts load as lazy messages, decoded only when accessed.
+    :return: (list) dialog
+    """
+    existing = [path for path in context_files.values() if os.path.exists(path)]
+    if not existing:
+        return []
+    return _context_read(max(existing, key=os.path.getmtime))
 
 
-def context_save(dialog_):
+def _context_write(path: str, dialog: list) -> None:
+    if path.endswith(".ctx"):
+        store_write(path, dialog)
+        return
+    with open(path, "w") as f:
+        json.dump([dict(message) for message in dialog], f)
+
+
+def context_save(dialog_, fmt: str = config.DEFAULT_CONTEXT_FORMAT):
     dialog = dialog_.copy()
 
     # remove system messages
@@ -101,27 +158,58 @@ def context_save(dialog_):
     # truncate dialog to max history message count
     dialog = dialog[-MAX_HISTORY_MESSAGE_COUNT:]
 
-    # save dialog to file
-    if not os.path.exists(os.path.dirname(context_file)):
-        os.makedirs(os.path.dirname(context_file))
-    with open(context_file, "w") as f:
-        json.dump(dialog, f)
+    # save dialog to file (and drop the session's file in the other format)
+    if not os.path.exists(context_folder):
+        os.makedirs(context_folder)
+    _context_write(context_files[fmt], dialog)
+    for path in context_files.values():
+        if path != context_files[fmt] and os.path.exists(path):
+            os.remove(path)
+
+
+def context_convert_all(fmt: str) -> int:
+    """
+    Convert every saved context (all sessions) to the given format.
+    :param fmt: (str) 'json' or 'binary'
+    :return: (int) number of contexts converted
+    """
+    extension = os.path.splitext(context_files[fmt])[1]
+    converted = 0
+    if not os.path.exists(context_folder):
+        return converted
+    for file in os.listdir(context_folder):
+        name, file_extension = os.path.splitext(file)
+        if file_extension not in (".json", ".ctx") or file_extension == extension:
+            continue
+        path = os.path.join(context_folder, file)
+        _context_write(
+            os.path.join(context_folder, name + extension), _context_read(path)
+        )
+        os.remove(path)
+        converted += 1
+    return converted
 
 
 def context_prune_all() -> None:
     """
-    Prune context folder of stale files.
+    Prune context (and editor draft) folders of stale files.
     :return: None
     """
-    if os.path.exists(context_folder):
-        for file in os.listdir(context_folder):
-            pid = int(file.split(".")[0])
-            file_update_time = os.path.getmtime(os.path.join(context_folder, file))
+    for folder in (context_folder, draft_folder):
+        if not os.path.exists(folder):
+            continue
+        for file in os.listdir(folder):
+            # only <pid>.* files are ours (e.g. skip the editor's .<pid>.md.swp)
+            stem = file.split(".")[0]
+            if not stem.isdigit():
+                continue
+            pid = int(stem)
+            file_update_time = os.path.getmtime(os.path.join(folder, file))
             if not psutil.pid_exists(pid):
-                debug(f"Deleting {file} from {context_folder} (pid {pid} not running)")
-                os.remove(os.path.join(context_folder, file))
+                debug(f"Deleting {file} from {folder} (pid {pid} not running)")
+                os.remove(os.path.join(folder, file))
             elif time.time() - file_update_time > (
                 PRUNE_CONTEXT_AFTER_DAYS * 24 * 60 * 60
             ):
-                debug(f"Deleting {file} from {context_folder} (older than 30 days)")
-                os.remove(os.path.join(context_folder, file))
+                debug(f"Deleting {file} from {folder} (older than 30 days)")
+                os.remove(os.path.join(folder, file))
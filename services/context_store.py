@@ -0,0 +1,220 @@
+import mmap
+import os
+import struct
+import zlib
+from collections.abc import Mapping
+from typing import Iterable, Optional
+
+from config import CONTEXT_COMPRESSION, CONTEXT_COMPRESS_MIN_BYTES
+from utils.errors import ContextFormatError
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+"""
+Compact binary context format.
+
+    header   b"CLMPCTX1"
+    records  [u32 length][u8 flags][u8 role length][role][content] ...
+    index    [u64 record offset] * count
+    footer   [u32 count][u64 index offset] b"CLMPIDX1"
+
+`length` covers everything after the length field. The content of each record is
+optionally zlib/zstd compressed (flags). The fixed-size footer and offset index
+give random access to any message, so loading a context only maps the file;
+messages are decoded one at a time, when first accessed.
+"""
+
+HEADER_MAGIC = b"CLMPCTX1"
+FOOTER_MAGIC = b"CLMPIDX1"
+FOOTER = struct.Struct("<IQ8s")
+RECORD = struct.Struct("<IBB")
+
+FLAG_ZLIB = 1
+FLAG_ZSTD = 2
+
+
+class Message(Mapping):
+    """
+    A read-only dialog message ({"role": ..., "content": ...}) that decodes its
+    role and content from the store only when first accessed.
+    """
+
+    __slots__ = ("_store", "_index", "_role", "_content")
+
+    def __init__(
+        self,
+        role: Optional[str] = None,
+        content: Optional[str] = None,
+        store: Optional["ContextStore"] = None,
+        index: int = -1,
+    ):
+        self._store = store
+        self._index = index
+        self._role = role
+        self._content = content
+
+    @property
+    def role(self) -> str:
+        if self._role is None:
+            self._role = self._store.read_role(self._index)
+        return self._role
+
+    @property
+    def content(self) -> str:
+        if self._content is None:
+            self._content = self._store.read_content(self._index)
+        return self._content
+
+    def raw_record(self) -> Optional[bytes]:
+        """
+        The encoded record, if this message came from a store (lets it be re-saved
+        without a decode/encode round trip).
+        """
+        if self._store is None:
+            return None
+        return self._store.read_record(self._index)
+
+    def __getitem__(self, key: str) -> str:
+        if key == "role":
+            return self.role
+        if key == "content":
+            return self.content
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(("role", "content"))
+
+    def __len__(self) -> int:
+        return 2
+
+    def __repr__(self) -> str:
+        return f"Message(role={self.role!r}, content={self.content!r})"
+
+
+class ContextStore:
+    def __init__(self, path: str):
+        """
+        Map a binary context file for reading.
+        :param path: (str) context file path
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < len(HEADER_MAGIC) + FOOTER.size:
+                raise ContextFormatError(f"{path} is not a binary context file")
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = self._buf
+        if buf[: len(HEADER_MAGIC)] != HEADER_MAGIC:
+            raise ContextFormatError(f"{path} is not a binary context file")
+        count, index_offset, magic = FOOTER.unpack_from(buf, len(buf) - FOOTER.size)
+        if magic != FOOTER_MAGIC:
+            raise ContextFormatError(f"{path} has a truncated or corrupt index")
+        self._offsets = struct.unpack_from(f"<{count}Q", buf, index_offset)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, index: int) -> Message:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return Message(store=self, index=index)
+
+    def messages(self, start: int = 0) -> list[Message]:
+        """
+        Lazy messages from `start` (negative counts from the end) to the end.
+        """
+        return [Message(store=self, index=i) for i in range(len(self))[start:]]
+
+    def read_record(self, index: int) -> bytes:
+        offset = self._offsets[index]
+        length, _, _ = RECORD.unpack_from(self._buf, offset)
+        return self._buf[offset: offset + 4 + length]
+
+    def read_role(self, index: int) -> str:
+        offset = self._offsets[index]
+        _, _, role_length = RECORD.unpack_from(self._buf, offset)
+        start = offset + RECORD.size
+        return self._buf[start: start + role_length].decode()
+
+    def read_content(self, index: int) -> str:
+        offset = self._offsets[index]
+        length, flags, role_length = RECORD.unpack_from(self._buf, offset)
+        content = self._buf[offset + RECORD.size + role_length: offset + 4 + length]
+        if flags & FLAG_ZLIB:
+            content = zlib.decompress(content)
+        elif flags & FLAG_ZSTD:
+            if zstandard is None:
+                raise ContextFormatError("zstandard is required to read this context")
+            content = zstandard.ZstdDecompressor().decompress(content)
+        return content.decode()
+
+
+def encode_record(
+    role: str, content: str, compression: str = CONTEXT_COMPRESSION
+) -> bytes:
+    """
+    Encode a single message record.
+    :param compression: (str) "zlib", "zstd" or "" (zstd falls back to zlib if the
+        zstandard package isn't installed)
+    :return: (bytes) record
+    """
+    role_bytes = role.encode()
+    content_bytes = content.encode()
+    flags = 0
+    if compression and len(content_bytes) >= CONTEXT_COMPRESS_MIN_BYTES:
+        if compression == "zstd" and zstandard is not None:
+            compressed = zstandard.ZstdCompressor().compress(content_bytes)
+            flag = FLAG_ZSTD
+        else:
+            compressed = zlib.compress(content_bytes)
+            flag = FLAG_ZLIB
+        if len(compressed) < len(content_bytes):
+            content_bytes, flags = compressed, flag
+    length = 2 + len(role_bytes) + len(content_bytes)
+    return RECORD.pack(length, flags, len(role_bytes)) + role_bytes + content_bytes
+
+
+def store_write(
+    path: str, dialog: Iterable[Mapping], compression: str = CONTEXT_COMPRESSION
+) -> None:
+    """
+    Atomically write a dialog to a binary context file.
+    :param path: (str) context file path
+    :param dialog: messages (dicts or lazy Messages)
+    :param compression: (str) compression for newly encoded records (records of
+        lazy messages are copied as they are)
+    :return: None
+    """
+    chunks = [HEADER_MAGIC]
+    offsets = []
+    position = len(HEADER_MAGIC)
+    for message in dialog:
+        record = message.raw_record() if isinstance(message, Message) else None
+        if record is None:
+            record = encode_record(
+                message.get("role"), message.get("content"), compression
+            )
+        offsets.append(position)
+        chunks.append(record)
+        position += len(record)
+    chunks.append(struct.pack(f"<{len(offsets)}Q", *offsets))
+    chunks.append(FOOTER.pack(len(offsets), position, FOOTER_MAGIC))
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.writelines(chunks)
+    os.replace(tmp_path, path)
+
+
+def store_read(path: str, start: int = 0) -> list[Message]:
+    """
+    Load lazy messages from a binary context file.
+    :param path: (str) context file path
+    :param start: (int) first message to return (negative counts from the end)
+    :return: (list) lazy Messages
+    """
+    return ContextStore(path).messages(start)
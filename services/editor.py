@@ -2,9 +2,17 @@ import os
 import subprocess
 import tempfile
 
+from config import APP_NAME
+
 
 DEFAULT_EDITOR = "vi"
 
+# lines starting with this are responses/notes and are never sent
+DRAFT_COMMENT_PREFIX = "#|"
+
+draft_folder = os.path.join(os.path.expanduser("~"), ".config", APP_NAME, "drafts")
+draft_file = os.path.join(draft_folder, f"{os.getppid()}.md")
+
 
 def edit_string(prompt: str) -> str:
     """
@@ -22,3 +30,48 @@ def edit_string(prompt: str) -> str:
             prompt = edited_file.read().strip()
 
     return prompt
+
+
+def draft_strip_comments(text: str) -> str:
+    """
+    Remove comment (response) lines from a draft.
+    :param text: (str) draft text
+    :return: (str) the prompt part of the draft
+    """
+    return "\n".join(
+        line
+        for line in text.split("\n")
+        if not line.startswith(DRAFT_COMMENT_PREFIX)
+    ).strip()
+
+
+def draft_edit(prompt: str = "", response: str = "") -> str:
+    """
+    Edit the session's persistent draft in the default editor.
+
+    The draft survives between runs (one per shell session). If a prompt is given
+    it replaces the draft; if a response is given it is appended as comments so
+    the whole conversation can be followed from the editor.
+    :param prompt: (str) optional prompt to start the draft with
+    :param response: (str) optional response to append as comments
+    :return: (str) edited draft, without comment lines
+    """
+    text = prompt
+    if not text and os.path.exists(draft_file):
+        with open(draft_file, "r") as f:
+            text = f.read()
+    if response:
+        comments = "\n".join(
+            f"{DRAFT_COMMENT_PREFIX} {line}".rstrip() for line in response.split("\n")
+        )
+        text = f"{text.rstrip()}\n\n{comments}\n"
+
+    if not os.path.exists(draft_folder):
+        os.makedirs(draft_folder)
+    with open(draft_file, "w") as f:
+        f.write(text)
+
+    editor = os.environ.get("EDITOR", DEFAULT_EDITOR)
+    subprocess.call([editor, draft_file])
+    with open(draft_file, "r") as f:
+        return draft_strip_comments(f.read())
@@ -1,5 +1,7 @@
 import os
 from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Optional
 
 from services.term import get_terminal_width
 
@@ -14,9 +16,13 @@ from pygments.formatters import (
 )
 
 
-def display_style_grid():
-    styles = pygments.styles.get_all_styles()  # noqa
-    styles = sorted(styles)
+def display_style_grid(styles: Optional[list[str]] = None):
+    """
+    Print style names in columns.
+    :param styles: (list) style names (defaults to asking pygments, which imports
+        every style)
+    """
+    styles = sorted(styles or pygments.styles.get_all_styles())  # noqa
     # determine max style name length
     max_style_name_length = max([len(s) for s in styles])
     terminal_columns = get_terminal_width() // (max_style_name_length + 2)
@@ -47,9 +53,11 @@ class Formatter(ABC):
             return guess_lexer(code)
 
     @staticmethod
+    @lru_cache(maxsize=None)
     def get_pygments_formatter(style: str):
         """
-        determine the pygments formatter to use
+        determine the pygments formatter to use (built once per style; $TERM
+        doesn't change during a run)
         :return: pygments formatter
         """
         term = os.environ.get("TERM", "").lower()
@@ -0,0 +1,261 @@
+import glob
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from jinja2 import Environment, FileSystemLoader, meta
+from jinja2.exceptions import TemplateError
+
+import services.llm as llm
+import services.proompt as proompt
+from config import HARNESS_MAX_WORKERS, HARNESS_TEMPLATE_PARAMS, OPENAI_DEFAULT_MODEL
+from services.context import dialog_token_count, token_count
+from services.output import info
+from services.proompt import (
+    TEMPLATE_PARAMS,
+    apply_prompt_affixes,
+    get_system_prompt,
+    get_user_postfix_prompt,
+    get_user_prefix_prompt,
+    prompt_folder,
+    render_prompt_file,
+)
+from services.recorder import Recorder
+from services.renderers.renderer import CODE_BLOCK_RE
+from utils.errors import RecordingNotFoundError
+
+"""
+Template (proompt) test harness.
+
+Fixture files are JSON files in the test folder, each a list of cases:
+
+    [
+        {
+            "name": "hello world",
+            "template": "code",
+            "input": "hello world in C",
+            "model": "gpt-3.5-turbo",   (optional)
+            "temperature": 0,           (optional, defaults to 0)
+            "params": {"shell": "fish"},  (optional template params)
+            "expect": {
+                "contains": ["printf"],
+                "not_contains": ["Here is"],
+                "matches": ["#include\\\\s*<stdio.h>"],
+                "code_blocks": 1,
+                "max_tokens": 200,
+                "max_latency": 10
+            }
+        }
+    ]
+
+Responses are replayed from <folder>/recordings/ (see services.recorder), so runs
+are offline and deterministic; record (or refresh) them with --record. Templates
+are rendered with HARNESS_TEMPLATE_PARAMS (plus each case's params) rather than
+the live platform and shell, so recordings match on any machine. Latency and token
+counts (and max_latency / max_tokens) come from the recorded API response.
+"""
+
+
+def template_check_all(folder: str = prompt_folder) -> list[tuple[str, str]]:
+    """
+    Render every template in the folder without calling the API.
+    :param folder: (str) proompts folder
+    :return: (list) of (template file, problem)
+    """
+    problems = []
+    env = Environment(loader=FileSystemLoader(folder))
+    for path in sorted(glob.glob(os.path.join(folder, "*.jinja2"))):
+        name = os.path.basename(path)
+        try:
+            source, _, _ = env.loader.get_source(env, name)
+            undeclared = (
+                meta.find_undeclared_variables(env.parse(source))
+                - set(TEMPLATE_PARAMS)
+                - set(env.globals)
+            )
+            if undeclared:
+                problems.append(
+                    (name, f"undefined variable(s): {', '.join(sorted(undeclared))}")
+                )
+                continue
+            render_prompt_file(path, strict=True)
+        except TemplateError as e:
+            problems.append((name, f"{type(e).__name__}: {e}"))
+    return problems
+
+
+def load_cases(folder: str) -> list[dict]:
+    """
+    Load every fixture case in the folder.
+    :param folder: (str) test folder
+    :return: (list) cases
+    """
+    cases = []
+    for path in sorted(glob.glob(os.path.join(folder, "*.json"))):
+        with open(path, "r") as f:
+            data = json.load(f)
+        fixture_name = os.path.splitext(os.path.basename(path))[0]
+        for i, case in enumerate(data if isinstance(data, list) else [data]):
+            case.setdefault("name", f"{fixture_name}[{i}]")
+            case.setdefault("template", "system")
+            cases.append(case)
+    return cases
+
+
+def check_expectations(
+    response: str, expect: dict, completion_tokens: int, latency: float
+) -> list[str]:
+    """
+    Check a response against a case's expected properties.
+    :return: (list) failure descriptions (empty if the case passed)
+    """
+    failures = []
+    for text in expect.get("contains", []):
+        if text not in response:
+            failures.append(f"missing {text!r}")
+    for text in expect.get("not_contains", []):
+        if text in response:
+            failures.append(f"unexpected {text!r}")
+    for pattern in expect.get("matches", []):
+        if not re.search(pattern, response, re.MULTILINE):
+            failures.append(f"no match for /{pattern}/")
+    if "code_blocks" in expect:
+        count = len(CODE_BLOCK_RE.findall(response))
+        if count != expect["code_blocks"]:
+            failures.append(f"{count} code blocks (expected {expect['code_blocks']})")
+    if "max_tokens" in expect and completion_tokens > expect["max_tokens"]:
+        failures.append(f"{completion_tokens} tokens > {expect['max_tokens']}")
+    if "max_latency" in expect and latency > expect["max_latency"]:
+        failures.append(f"{latency:.2f}s > {expect['max_latency']}s")
+    return failures
+
+
+def _prepare_case(case: dict) -> dict:
+    """
+    Render the case's templates (done up front, before running cases in parallel).
+    """
+    proompt.template_params_override = {
+        **HARNESS_TEMPLATE_PARAMS,
+        **case.get("params", {}),
+    }
+    template = case["template"]
+    system_prompt = get_system_prompt(template)
+    prefix_prompt = get_user_prefix_prompt(template)
+    postfix_prompt = get_user_postfix_prompt(template)
+    return {
+        **case,
+        "found": bool(system_prompt or prefix_prompt or postfix_prompt),
+        "dialog": [{"role": "system", "content": system_prompt}]
+        if system_prompt
+        else [],
+        "prompt": apply_prompt_affixes(
+            case.get("input", ""), prefix_prompt, postfix_prompt
+        ),
+    }
+
+
+def _run_case(case: dict) -> dict:
+    model = case.get("model", OPENAI_DEFAULT_MODEL)
+    result = {
+        "name": case["name"],
+        "template": case["template"],
+        "latency": 0.0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "failures": [],
+    }
+    if not case["found"]:
+        result["failures"].append(f"template '{case['template']}' not found")
+        return result
+
+    start = time.time()
+    try:
+        response = llm.query_chatgpt(
+            case["prompt"],
+            case["dialog"],
+            model=model,
+            temperature=case.get("temperature", 0),
+            template=case["template"],
+        )
+    except RecordingNotFoundError:
+        result["failures"].append("no recording (run with --record)")
+        return result
+    except Exception as e:  # noqa
+        result["failures"].append(f"{type(e).__name__}: {e}")
+        return result
+    # report what the API did when the response was recorded, not the replay
+    latency, usage = llm.completion_backend.last_stats()
+    result["latency"] = time.time() - start if latency is None else latency
+    if usage:
+        result["prompt_tokens"] = usage["prompt_tokens"]
+        result["completion_tokens"] = usage["completion_tokens"]
+    else:
+        result["prompt_tokens"] = dialog_token_count(
+            case["dialog"] + [{"role": "user", "content": case["prompt"]}],
+            model_name=model,
+        )
+        result["completion_tokens"] = token_count(response, model_name=model)
+    result["failures"] = check_expectations(
+        response,
+        case.get("expect", {}),
+        result["completion_tokens"],
+        result["latency"],
+    )
+    return result
+
+
+def template_test(
+    folder: str, record: bool = False, max_workers: int = HARNESS_MAX_WORKERS
+) -> bool:
+    """
+    Check all templates, run all fixture cases in parallel and print a report.
+    :param folder: (str) test folder with fixture files
+    :param record: (bool) call the API and re-record responses instead of replaying
+    :param max_workers: (int) number of cases to run at once
+    :return: (bool) True if everything passed
+    """
+    proompt.template_params_override = HARNESS_TEMPLATE_PARAMS
+    try:
+        problems = template_check_all()
+        for name, problem in problems:
+            info(f"FAIL  {name}: {problem}")
+        cases = [_prepare_case(case) for case in load_cases(folder)]
+    finally:
+        proompt.template_params_override = None
+
+    llm.completion_backend = Recorder(os.path.join(folder, "recordings"), record)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(_run_case, cases))
+    finally:
+        llm.completion_backend = None
+
+    templates = {}
+    for result in results:
+        status = "FAIL" if result["failures"] else "PASS"
+        info(
+            f"{status}  {result['template']}/{result['name']}"
+            f"  {result['latency']:.2f}s"
+            f"  {result['prompt_tokens']}+{result['completion_tokens']} tokens"
+        )
+        for failure in result["failures"]:
+            info(f"      - {failure}")
+        summary = templates.setdefault(result["template"], [0, 0, 0.0, 0])
+        summary[0] += 1
+        summary[1] += 0 if result["failures"] else 1
+        summary[2] += result["latency"]
+        summary[3] += result["prompt_tokens"] + result["completion_tokens"]
+
+    if templates:
+        info(f"\n{'template':<20} {'passed':>9} {'avg latency':>12} {'tokens':>9}")
+    for template, (count, passed, latency, tokens) in sorted(templates.items()):
+        info(
+            f"{template:<20} {f'{passed}/{count}':>9}"
+            f" {latency / count:>11.2f}s {tokens:>9}"
+        )
+    if not results:
+        info(f"No test cases found in {folder}")
+
+    return not problems and all(not result["failures"] for result in results)
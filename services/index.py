@@ -0,0 +1,230 @@
+import importlib.util
+import json
+import os
+from typing import Optional
+
+from config import APP_NAME, OPENAI_DEFAULT_MODEL, OPENAI_PRICING, OPENAI_RATE_LIMITS
+from services.output import debug
+
+"""
+Precomputed metadata index for shell completion and the --list-* options.
+
+The index (~/.config/cloompt/index.json) holds one section per kind of metadata:
+templates (in the proompts folder), pygments styles, models and CLI options.
+Each section records the mtimes of the files it was built from and is rebuilt
+only when one of them changes. This module imports nothing heavy at load time,
+so completion can read the index without starting the CLI; pygments and click
+are only needed to rebuild the styles and options sections.
+"""
+
+# same folder as services.proompt.prompt_folder (which would pull in jinja2)
+prompt_folder = os.path.join(os.path.expanduser("~"), ".config", APP_NAME, "proompts")
+index_file = os.path.join(os.path.expanduser("~"), ".config", APP_NAME, "index.json")
+
+INDEX_SECTIONS = ("templates", "styles", "models", "options")
+TEMPLATE_SUFFIXES = (".prefix", ".postfix")
+
+# what to complete for the value of each option (by click parameter name)
+OPTION_COMPLETIONS = {
+    "prompt_template": "templates",
+    "style": "styles",
+    "model": "models",
+    "out_dir": "dirs",
+    "test_templates": "dirs",
+    "system_prompt_override": "files",
+    "prefix_prompt_override": "files",
+    "postfix_prompt_override": "files",
+}
+
+
+def _styles_folder() -> str:
+    # locate pygments without importing it
+    spec = importlib.util.find_spec("pygments")
+    if spec is None or not spec.origin:
+        return ""
+    return os.path.join(os.path.dirname(spec.origin), "styles")
+
+
+def index_sources(section: str) -> list[str]:
+    """
+    Files (or folders) a section is built from.
+    :param section: (str) index section
+    :return: (list) paths
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return {
+        "templates": lambda: [prompt_folder],
+        "styles": lambda: [_styles_folder()],
+        "models": lambda: [os.path.join(root, "config.py")],
+        "options": lambda: [
+            os.path.join(root, "cloompt.py"),
+            os.path.join(root, "config.py"),
+        ],
+    }[section]()
+
+
+def _fingerprint(paths: list[str]) -> list[int]:
+    return [os.stat(path).st_mtime_ns if os.path.exists(path) else 0 for path in paths]
+
+
+def list_templates(folder: str = prompt_folder) -> list[str]:
+    """
+    Template names in the proompts folder (e.g. 'code' for code.jinja2 and
+    code.postfix.jinja2).
+    :param folder: (str) proompts folder
+    :return: (list) sorted template names
+    """
+    if not os.path.isdir(folder):
+        return []
+    templates = set()
+    for file in os.listdir(folder):
+        name, extension = os.path.splitext(file)
+        if extension != ".jinja2":
+            continue
+        for suffix in TEMPLATE_SUFFIXES:
+            if name.endswith(suffix):
+                name = name[: -len(suffix)]
+        templates.add(name)
+    return sorted(templates)
+
+
+def list_styles() -> list[str]:
+    from pygments.styles import get_all_styles
+
+    return sorted(get_all_styles())
+
+
+def list_models() -> list[str]:
+    models = set(OPENAI_RATE_LIMITS) | set(OPENAI_PRICING) | {OPENAI_DEFAULT_MODEL}
+    return sorted(models)
+
+
+def list_options(command) -> list[dict]:
+    """
+    Describe a click command's options.
+    :param command: click.Command
+    :return: (list) of {"opts", "help", "value", "choices", "complete"}, where
+        value is "none" (a flag), "optional" or "required"
+    """
+    import click
+
+    options = []
+    for param in command.params:
+        if not isinstance(param, click.Option):
+            continue
+        choices = param.type.choices if isinstance(param.type, click.Choice) else None
+        if param.is_flag:
+            value = "none"
+        elif getattr(param, "_flag_needs_value", False):  # e.g. --history [json]
+            value = "optional"
+        else:
+            value = "required"
+        options.append(
+            {
+                "opts": param.opts + param.secondary_opts,
+                "help": param.help or "",
+                "value": value,
+                "choices": list(choices) if choices else None,
+                "complete": OPTION_COMPLETIONS.get(param.name),
+            }
+        )
+    return options
+
+
+def index_load() -> dict:
+    """
+    Read the index as it is on disk (no staleness checks).
+    :return: (dict) sections (empty if there's no readable index)
+    """
+    try:
+        with open(index_file, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def index_refresh(
+    sections: tuple = INDEX_SECTIONS, command=None, index: Optional[dict] = None
+) -> dict:
+    """
+    Rebuild stale sections of the index and write it back if anything changed.
+    :param sections: (tuple) sections to check
+    :param command: click.Command to describe (the options section is left as it
+        is without one)
+    :param index: (dict) already loaded index, to save reading it again
+    :return: (dict) index
+    """
+    index = index_load() if index is None else index
+    builders = {
+        "templates": list_templates,
+        "styles": list_styles,
+        "models": list_models,
+        "options": lambda: list_options(command),
+    }
+    changed = False
+    for section in sections:
+        if section == "options" and command is None:
+            continue
+        sources = _fingerprint(index_sources(section))
+        if index.get(section, {}).get("sources") == sources:
+            continue
+        debug(f"Rebuilding index section '{section}'")
+        index[section] = {"sources": sources, "items": builders[section]()}
+        changed = True
+
+    if changed:
+        try:
+            os.makedirs(os.path.dirname(index_file), exist_ok=True)
+            tmp_file = f"{index_file}.{os.getpid()}.tmp"
+            with open(tmp_file, "w") as f:
+                json.dump(index, f)
+            os.replace(tmp_file, index_file)
+        except OSError as e:
+            debug(f"Unable to write index {index_file}: {e}")
+    return index
+
+
+def _fish_quote(text: str) -> str:
+    return "'" + text.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def fish_completions(options: list[dict], command: str, complete_command: str) -> str:
+    """
+    Generate a fish completion script from the index's options section.
+    Template, style and model values are completed at completion time by running
+    complete_command, so they stay current without regenerating the script.
+    :param options: (list) the options section's items
+    :param command: (str) fish function to complete, e.g. 'lm'
+    :param complete_command: (str) command line that runs complete.py
+    :return: (str) fish script
+    """
+    lines = [
+        f"# fish completions for {command} (generated by complete.py from the"
+        " cloompt index)",
+        f"complete -c {command} -f",
+    ]
+    for option in options:
+        parts = [f"complete -c {command}"]
+        for opt in option["opts"]:
+            if opt.startswith("--"):
+                parts.append(f"-l {opt[2:]}")
+            else:
+                parts.append(f"-s {opt[1:]}")
+        complete = option["complete"]
+        if option["value"] == "required":
+            if option["choices"]:
+                parts.append(f"-x -a {_fish_quote(' '.join(option['choices']))}")
+            elif complete == "files":
+                parts.append("-r -F")
+            elif complete == "dirs":
+                parts.append("-x -a '(__fish_complete_directories)'")
+            elif complete:
+                parts.append(
+                    f"-x -a {_fish_quote(f'({complete_command} {complete})')}"
+                )
+            else:
+                parts.append("-x")
+        if option["help"]:
+            parts.append(f"-d {_fish_quote(' '.join(option['help'].split()))}")
+        lines.append(" ".join(parts))
+    return "\n".join(lines) + "\n"
@@ -1,3 +1,6 @@
+import time
+from typing import Callable, Optional
+
 import openai
 
 from config import (
@@ -6,14 +9,35 @@ from config import (
     OPENAI_REQUEST_TIMEOUT,
     MAX_DIALOG_REQUEST_SIZE,
     OPENAI_MAX_TOKENS,
+    OPENAI_RESERVED_COMPLETION_TOKENS,
+    RATE_LIMIT_ENABLED,
 )
-from services.context import dialog_token_count
+from services.context import message_token_count, token_count
+from services.ratelimit import rate_limit_acquire, rate_limit_settle
+from services.usage import usage_record
 from utils.errors import PromptTooLongError
 
+# set to a services.recorder.Recorder to record/replay responses (template tests)
+completion_backend = None
+
 
 def query_chatgpt(
-    prompt, dialog_, model=OPENAI_DEFAULT_MODEL, temperature: float = 1.0
+    prompt,
+    dialog_,
+    model=OPENAI_DEFAULT_MODEL,
+    temperature: float = 1.0,
+    template: str = "",
+    on_chunk: Optional[Callable[[str], None]] = None,
+    prompt_tokens: Optional[int] = None,
 ) -> str:
+    """
+    Send the prompt (plus as much of the dialog as fits) to the chat API.
+    :param on_chunk: optional callback; if given, the response is streamed and
+        each content delta is passed to it as it arrives.
+    :param prompt_tokens: token count of the prompt, if the caller already has it
+    :return: (str) the full response content
+    """
+    model = model if model else OPENAI_DEFAULT_MODEL
     dialog = dialog_.copy()
     dialog.append({"role": "user", "content": prompt})
 
@@ -21,19 +45,73 @@ def query_chatgpt(
     dialog = dialog[-MAX_DIALOG_REQUEST_SIZE:]
 
     # Remove from top of dialog until the token count is <= OPENAI_MAX_TOKENS
-    while dialog_token_count(dialog, model_name=model) > OPENAI_MAX_TOKENS:
+    t_counts = [message_token_count(message, model) for message in dialog[:-1]]
+    t_counts.append(message_token_count(dialog[-1], model, prompt_tokens))
+    while sum(t_counts) > OPENAI_MAX_TOKENS:
         dialog = dialog[1:]
+        t_counts = t_counts[1:]
+    t_count = sum(t_counts)
 
     if len(dialog) == 0:
         raise PromptTooLongError()
 
-    response = openai.ChatCompletion.create(
-        model=model if model else OPENAI_DEFAULT_MODEL,
+    # lazily loaded (binary context) messages are decoded here, once
+    dialog = [dict(message) for message in dialog]
+
+    backend = completion_backend
+    offline = bool(backend and backend.offline)
+    rate_limited = RATE_LIMIT_ENABLED and not offline
+    create = backend.create if backend else openai.ChatCompletion.create
+
+    # wait our turn for rpm/tpm capacity shared with other cloompt processes
+    reserved_tokens = t_count + OPENAI_RESERVED_COMPLETION_TOKENS
+    if rate_limited:
+        rate_limit_acquire(model, reserved_tokens)
+
+    start = time.time()
+    response = create(
+        model=model,
         messages=dialog,
         timeout=OPENAI_READ_TIMEOUT,
         request_timeout=OPENAI_REQUEST_TIMEOUT,
         temperature=temperature,
+        stream=on_chunk is not None,
     )
 
+    if on_chunk is None:
+        content = response["choices"][0]["message"]["content"]
+        usage = response.get("usage")
+    else:
+        deltas = []
+        for chunk in response:
+            delta = chunk["choices"][0]["delta"].get("content")
+            if delta:
+                deltas.append(delta)
+                on_chunk(delta)
+        content = "".join(deltas)
+        # streamed responses carry no usage, so count it ourselves
+        completion_tokens = token_count(content, model_name=model)
+        usage = {
+            "prompt_tokens": t_count,
+            "completion_tokens": completion_tokens,
+            "total_tokens": t_count + completion_tokens,
+        }
+
+    latency = time.time() - start
+
+    if usage:
+        # give back (or charge) the difference between reserved and actual tokens
+        if rate_limited:
+            rate_limit_settle(model, reserved_tokens, usage["total_tokens"])
+        # replayed responses never reached the API, so keep them out of the ledger
+        if not offline:
+            usage_record(
+                model,
+                template,
+                usage["prompt_tokens"],
+                usage["completion_tokens"],
+                latency,
+            )
+
     # return the raw response
-    return response["choices"][0]["message"]["content"]
+    return content
@@ -18,6 +18,14 @@ def print_stderr(*args, **kwargs):
     print(*args, file=sys.stderr, **kwargs)
 
 
+def echo(text: str) -> None:
+    """
+    Write fully rendered output to stdout in one large write (not line by line).
+    """
+    sys.stdout.write(text + "\n")
+    sys.stdout.flush()
+
+
 debug = logger.debug if DEBUG else lambda *args, **kwargs: None
 exception = logger.exception if DEBUG else lambda *args, **kwargs: None
 error = logger.error if DEBUG else print_stderr
@@ -0,0 +1,247 @@
+import os
+import re
+import shlex
+import subprocess
+import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+from pygments.lexers import get_lexer_by_name
+from pygments.util import ClassNotFound as PygmentsClassNotFound
+
+from config import PIPELINE_MAX_WORKERS, PIPELINE_VALIDATOR_TIMEOUT
+from services.output import debug, print_stderr
+
+"""
+Streaming output pipeline for code blocks.
+
+Response text is fed in as it arrives. Each fenced code block is written to
+`out_dir` (atomically) as soon as its closing fence is seen, and validated in a
+worker pool while the rest of the response is still streaming in.
+
+File names come from the fence info string when it carries one
+(```python main.py, ```python:main.py, ```main.py), otherwise block_<n> plus the
+language's extension. Validators are commands with an optional `{path}`
+placeholder, optionally scoped to an extension or language: `py:ruff check {path}`.
+"""
+
+# an opening fence is 3+ backticks; only a bare fence at least as long closes it,
+# so ````markdown blocks can contain ``` fenced blocks
+FENCE_RE = re.compile(r"^(`{3,})(.*)$")
+
+
+class CodeBlock:
+    __slots__ = ("index", "language", "filename", "code", "path", "validation")
+
+    def __init__(self, index: int, language: str, filename: str, code: str):
+        self.index = index
+        self.language = language
+        self.filename = filename
+        self.code = code
+        self.path: str = ""
+        self.validation: Optional[Future] = None
+
+
+def get_extension(language: str) -> str:
+    """
+    Determine the file extension for a language string, e.g. 'python' -> '.py'
+    :param language: (str) fence language string
+    :return: (str) extension including the dot, '.txt' if unknown
+    """
+    try:
+        filenames = get_lexer_by_name(language).filenames
+    except PygmentsClassNotFound:
+        return ".txt"
+    for pattern in filenames:
+        if pattern.startswith("*.") and not any(c in pattern[2:] for c in "*?["):
+            return pattern[1:]
+    return ".txt"
+
+
+def parse_info_string(info: str) -> tuple[str, str]:
+    """
+    Split a fence info string into (language, filename).
+    :param info: (str) text following the opening fence
+    :return: (tuple) language, filename ("" when not present)
+    """
+    language, filename = "", ""
+    for token in re.split(r"[\s:]+", info.strip()):
+        token = token.strip("\"'")
+        if token.startswith(("file=", "title=")):
+            token = token.split("=", 1)[1]
+        if not token:
+            continue
+        if "." in token or "/" in token:
+            filename = filename or token
+        elif not language:
+            language = token
+    return language, filename
+
+
+def parse_validators(validators: tuple[str, ...]) -> list[tuple[str, str]]:
+    """
+    Parse validator specs of the form "[<ext|language>:]<command>".
+    :return: (list) of (scope, command); scope "" applies to every block
+    """
+    parsed = []
+    for validator in validators:
+        match = re.match(r"^([\w+.-]+):(?!/)(.*)$", validator)
+        if match and match.group(2).strip():
+            parsed.append((match.group(1).lstrip(".").lower(), match.group(2).strip()))
+        else:
+            parsed.append(("", validator.strip()))
+    return parsed
+
+
+class CodeBlockPipeline:
+    def __init__(
+        self,
+        out_dir: str,
+        validators: tuple[str, ...] = (),
+        max_workers: int = PIPELINE_MAX_WORKERS,
+    ):
+        self.out_dir = os.path.abspath(os.path.expanduser(out_dir))
+        self.validators = parse_validators(validators)
+        self.blocks: list[CodeBlock] = []
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._pending = ""
+        self._block_info: Optional[str] = None  # None when outside a block
+        self._fence_length = 0
+        self._block_lines: list[str] = []
+        self._filenames: set[str] = set()
+        os.makedirs(self.out_dir, exist_ok=True)
+        # mkstemp creates 0600 files; give written files the usual umask'd mode
+        umask = os.umask(0)
+        os.umask(umask)
+        self._file_mode = 0o666 & ~umask
+
+    def feed(self, chunk: str) -> None:
+        """
+        Feed streamed response text; complete code blocks are routed immediately.
+        :param chunk: (str) response text delta
+        """
+        self._pending += chunk
+        *lines, self._pending = self._pending.split("\n")
+        for line in lines:
+            self._feed_line(line)
+
+    def _feed_line(self, line: str) -> None:
+        stripped = line.strip()
+        if self._block_info is None:
+            fence = FENCE_RE.match(stripped)
+            if fence:
+                self._fence_length = len(fence.group(1))
+                self._block_info = fence.group(2)
+                self._block_lines = []
+        elif len(stripped) >= self._fence_length and stripped == "`" * len(stripped):
+            self._emit()
+        else:
+            self._block_lines.append(line)
+
+    def _emit(self) -> None:
+        language, filename = parse_info_string(self._block_info or "")
+        index = len(self.blocks) + 1
+        block = CodeBlock(
+            index,
+            language,
+            self._unique_filename(filename, language, index),
+            "\n".join(self._block_lines) + "\n",
+        )
+        self._block_info = None
+        self._block_lines = []
+        self.blocks.append(block)
+
+        block.path = self._write(block)
+        print_stderr(f"wrote {block.path}")
+        command = self._validator_for(block)
+        if command:
+            block.validation = self._pool.submit(self._validate, command, block.path)
+
+    def _unique_filename(self, filename: str, language: str, index: int) -> str:
+        # never let the model write outside out_dir
+        filename = os.path.basename(os.path.normpath(filename)) if filename else ""
+        if not filename or filename in (".", ".."):
+            filename = f"block_{index}{get_extension(language)}"
+        base, ext = os.path.splitext(filename)
+        candidate, n = filename, 2
+        while candidate in self._filenames:
+            candidate = f"{base}_{n}{ext}"
+            n += 1
+        self._filenames.add(candidate)
+        return candidate
+
+    def _write(self, block: CodeBlock) -> str:
+        path = os.path.join(self.out_dir, block.filename)
+        fd, tmp_path = tempfile.mkstemp(dir=self.out_dir, prefix=f".{block.filename}.")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(block.code)
+            os.chmod(tmp_path, self._file_mode)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return path
+
+    def _validator_for(self, block: CodeBlock) -> str:
+        ext = os.path.splitext(block.filename)[1].lstrip(".").lower()
+        for scope, command in self.validators:
+            if not scope or scope in (ext, block.language.lower()):
+                return command
+        return ""
+
+    @staticmethod
+    def _validate(command: str, path: str) -> tuple[bool, str]:
+        args = shlex.split(command)
+        if any("{path}" in arg for arg in args):
+            args = [arg.replace("{path}", path) for arg in args]
+        else:
+            args.append(path)
+        debug(f"Validating {path}: {args}")
+        try:
+            result = subprocess.run(
+                args,
+                capture_output=True,
+                text=True,
+                timeout=PIPELINE_VALIDATOR_TIMEOUT,
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            return False, str(e)
+        return result.returncode == 0, (result.stdout + result.stderr).strip()
+
+    def close(self) -> bool:
+        """
+        Flush any unterminated block, wait for validators and report results.
+        :return: (bool) True if every validated block passed
+        """
+        if self._pending:
+            self._feed_line(self._pending)
+            self._pending = ""
+        if self._block_info is not None and self._block_lines:
+            self._emit()
+        if not self.blocks:
+            print_stderr("No code blocks found in response.")
+
+        passed = True
+        for block in self.blocks:
+            if block.validation is None:
+                continue
+            ok, output = block.validation.result()
+            passed = passed and ok
+            print_stderr(f"{'ok' if ok else 'FAILED'} {block.path}")
+            if output and not ok:
+                print_stderr(output)
+        self._pool.shutdown()
+        return passed
+
+    def abort(self) -> None:
+        """
+        Stop after a failed response: drop any unterminated (cut off) block and
+        shut down the validators without reporting.
+        :return: None
+        """
+        self._pending = ""
+        self._block_info = None
+        self._block_lines = []
+        self._pool.shutdown(cancel_futures=True)
@@ -2,20 +2,43 @@ import os
 import platform
 from typing import Optional
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, Undefined
+import psutil
 import shellingham
 
 from config import APP_NAME
+from services.cache import cache_get, cache_set
 
 
 prompt_folder = os.path.join(os.path.expanduser("~"), ".config", APP_NAME, "proompts")
 
 # these are the jinja2 params for proompts
+TEMPLATE_PARAMS = ("platform", "shell")
 platform_name = f"{platform.system()} {platform.release()}"
-try:
-    shell_name, _ = shellingham.detect_shell()
-except Exception:  # noqa
-    shell_name = "bash"
+
+# fixed values for TEMPLATE_PARAMS, used instead of the live ones when set (the
+# template test harness sets these so rendered prompts match across machines)
+template_params_override: Optional[dict] = None
+
+
+def get_shell_name() -> str:
+    """
+    Detect the user's shell, cached per parent process.
+    :return: (str) shell name, e.g. 'fish'
+    """
+    ppid = os.getppid()
+    try:
+        key = f"{ppid}:{psutil.Process(ppid).create_time()}"
+    except psutil.Error:
+        key = str(ppid)
+    shell_name = cache_get("shells", key)
+    if shell_name is None:
+        try:
+            shell_name, _ = shellingham.detect_shell()
+        except Exception:  # noqa
+            shell_name = "bash"
+        cache_set("shells", key, shell_name)
+    return shell_name
 
 
 def get_prompt_override(prompt_arg: Optional[str]) -> str:
@@ -34,6 +57,31 @@ def get_prompt_override(prompt_arg: Optional[str]) -> str:
     return prompt_arg
 
 
+def get_template_params() -> dict:
+    """
+    Values for the proompt template params.
+    :return: (dict) e.g. {"platform": "Linux 6.1.0", "shell": "fish"}
+    """
+    if template_params_override is not None:
+        return dict(template_params_override)
+    return {"platform": platform_name, "shell": get_shell_name()}
+
+
+def render_prompt_file(path: str, strict: bool = False) -> str:
+    """
+    Render a proompt template file.
+    :param path: (str) absolute path to the template
+    :param strict: (bool) raise on undefined variables instead of rendering ""
+    :return: (str) rendered template
+    """
+    env = Environment(
+        loader=FileSystemLoader("/"),
+        undefined=StrictUndefined if strict else Undefined,
+    )
+    template = env.get_template(path)
+    return template.render(**get_template_params())
+
+
 def get_prompt(
     prompt_template: Optional[str] = None, suffix: Optional[str] = ""
 ) -> str:
@@ -44,17 +92,37 @@ def get_prompt(
         prompt_folder, f"{prompt_template}{suffix}.jinja2"
     )
     if os.path.exists(user_prefix_prompt_path):
-        cwd = os.getcwd()
-        os.chdir(os.path.dirname(os.path.abspath(__file__)))
-        env = Environment(loader=FileSystemLoader("/"))
-        template = env.get_template(user_prefix_prompt_path)
-        user_prefix_prompt = template.render(platform=platform_name, shell=shell_name)
-        os.chdir(cwd)
+        # rendered templates are cached until the template file or params change
+        params = get_template_params()
+        stat = os.stat(user_prefix_prompt_path)
+        key = (
+            f"{user_prefix_prompt_path}:{stat.st_mtime_ns}:{stat.st_size}:"
+            f"{params['platform']}:{params['shell']}"
+        )
+        user_prefix_prompt = cache_get("proompts", key)
+        if user_prefix_prompt is not None:
+            return user_prefix_prompt
+
+        user_prefix_prompt = render_prompt_file(user_prefix_prompt_path)
+        cache_set("proompts", key, user_prefix_prompt)
         return user_prefix_prompt
 
     return ""
 
 
+def apply_prompt_affixes(prompt: str, prefix: str = "", postfix: str = "") -> str:
+    """
+    Wrap the user's prompt with the prefix and postfix proompts.
+    :return: (str) modified prompt
+    """
+    modified_prompt = prompt
+    if prefix:
+        modified_prompt = prefix + "\n\n" + prompt
+    if postfix:
+        modified_prompt += "\n\n" + postfix
+    return modified_prompt
+
+
 def get_user_prefix_prompt(prompt_template: Optional[str] = None) -> str:
     return get_prompt(prompt_template, ".prefix")
 
@@ -65,3 +133,29 @@ def get_user_postfix_prompt(prompt_template: Optional[str] = None) -> str:
 
 def get_system_prompt(prompt_template: Optional[str] = None) -> str:
     return get_prompt(prompt_template)
+
+
+def get_prompts(
+    prompt_template: Optional[str] = None,
+    system_prompt_override: str = "",
+    prefix_prompt_override: str = "",
+    postfix_prompt_override: str = "",
+) -> tuple[str, str, str]:
+    """
+    Load the system, prefix and postfix proompts for a template, applying overrides.
+    Overrides are loaded from file if they are valid paths, otherwise used as strings.
+    :return: (tuple) system prompt, user prefix prompt, user postfix prompt
+    """
+    if system_prompt_override:
+        system_prompt = get_prompt_override(system_prompt_override).strip()
+    else:
+        system_prompt = get_system_prompt(prompt_template)
+    if prefix_prompt_override:
+        user_prefix_prompt = get_prompt_override(prefix_prompt_override).strip()
+    else:
+        user_prefix_prompt = get_user_prefix_prompt(prompt_template)
+    if postfix_prompt_override:
+        user_postfix_prompt = get_prompt_override(postfix_prompt_override).strip()
+    else:
+        user_postfix_prompt = get_user_postfix_prompt(prompt_template)
+    return system_prompt, user_prefix_prompt, user_postfix_prompt
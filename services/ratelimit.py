@@ -0,0 +1,225 @@
+import fcntl
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import psutil
+
+from config import (
+    APP_NAME,
+    OPENAI_DEFAULT_RATE_LIMIT,
+    OPENAI_RATE_LIMITS,
+    RATE_LIMIT_POLL_INTERVAL,
+    RATE_LIMIT_QUEUE_TIMEOUT,
+)
+from services.output import debug, info
+from utils.errors import RateLimitTimeoutError
+
+"""
+Cross-process token-bucket scheduler.
+
+Every cloompt process on this machine shares a single state file, guarded by an
+exclusive flock. Each model has two buckets (requests/minute, tokens/minute)
+which refill continuously. Callers take a ticket and queue per model (FIFO), so
+concurrent processes are served fairly instead of all failing with 429s at once.
+"""
+
+ratelimit_folder = os.path.join(
+    os.path.expanduser("~"), ".config", APP_NAME, "ratelimit"
+)
+state_file = os.path.join(ratelimit_folder, "state.json")
+lock_file = os.path.join(ratelimit_folder, "state.lock")
+
+
+def get_rate_limit(model: str) -> tuple[int, int]:
+    """
+    Return the (requests per minute, tokens per minute) limits for a model.
+    :param model: (str) model name
+    :return: (tuple) rpm, tpm
+    """
+    return OPENAI_RATE_LIMITS.get(model, OPENAI_DEFAULT_RATE_LIMIT)
+
+
+@contextmanager
+def _locked_state():
+    """
+    Hold the exclusive lock and yield the shared state; it is written back on exit.
+    """
+    if not os.path.exists(ratelimit_folder):
+        os.makedirs(ratelimit_folder, exist_ok=True)
+    with open(lock_file, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            state = {}
+            if os.path.exists(state_file):
+                try:
+                    with open(state_file, "r") as f:
+                        state = json.load(f)
+                except (OSError, ValueError):
+                    debug(f"Discarding unreadable rate limit state {state_file}")
+            state.setdefault("buckets", {})
+            state.setdefault("queues", {})
+            state.setdefault("stats", {})
+            yield state
+            tmp_file = f"{state_file}.{os.getpid()}.tmp"
+            with open(tmp_file, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp_file, state_file)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _refill(state: dict, model: str, now: float) -> dict:
+    """
+    Refill (or create) the request and token buckets for a model.
+    """
+    rpm, tpm = get_rate_limit(model)
+    bucket = state["buckets"].setdefault(
+        model, {"requests": float(rpm), "tokens": float(tpm), "updated": now}
+    )
+    elapsed = max(0.0, now - bucket["updated"])
+    bucket["requests"] = min(float(rpm), bucket["requests"] + elapsed * rpm / 60)
+    bucket["tokens"] = min(float(tpm), bucket["tokens"] + elapsed * tpm / 60)
+    bucket["updated"] = now
+    return bucket
+
+
+def _prune_queue(queue: list, now: float) -> list:
+    """
+    Drop tickets whose process has died or that have been waiting too long.
+    """
+    return [
+        ticket
+        for ticket in queue
+        if psutil.pid_exists(ticket["pid"])
+        and now - ticket["enqueued"] <= RATE_LIMIT_QUEUE_TIMEOUT
+    ]
+
+
+def _record_wait(state: dict, model: str, waited: float) -> None:
+    stats = state["stats"].setdefault(
+        model, {"requests": 0, "queued": 0, "total_wait": 0.0, "max_wait": 0.0}
+    )
+    stats["requests"] += 1
+    if waited >= RATE_LIMIT_POLL_INTERVAL:
+        stats["queued"] += 1
+    stats["total_wait"] += waited
+    stats["max_wait"] = max(stats["max_wait"], waited)
+
+
+def rate_limit_acquire(model: str, tokens: int) -> float:
+    """
+    Block until there is capacity to send a request of `tokens` tokens to `model`.
+    :param model: (str) model name
+    :param tokens: (int) prompt tokens + reserved completion tokens
+    :return: (float) seconds spent waiting in the queue
+    """
+    _, tpm = get_rate_limit(model)
+    tokens = min(tokens, tpm)  # a request can never need more than a full bucket
+    ticket = {"id": f"{os.getpid()}-{time.time_ns()}", "pid": os.getpid()}
+    start = time.time()
+    acquired = False
+
+    with _locked_state() as state:
+        ticket["enqueued"] = start
+        state["queues"].setdefault(model, []).append(ticket)
+
+    try:
+        while True:
+            now = time.time()
+            if now - start > RATE_LIMIT_QUEUE_TIMEOUT:
+                raise RateLimitTimeoutError()
+            delay = RATE_LIMIT_POLL_INTERVAL
+            with _locked_state() as state:
+                queue = _prune_queue(state["queues"].get(model, []), now)
+                if not any(t["id"] == ticket["id"] for t in queue):
+                    queue.append(ticket)  # we were pruned while the clock jumped
+                state["queues"][model] = queue
+                bucket = _refill(state, model, now)
+                if queue[0]["id"] == ticket["id"]:
+                    if bucket["requests"] >= 1 and bucket["tokens"] >= tokens:
+                        bucket["requests"] -= 1
+                        bucket["tokens"] -= tokens
+                        queue.pop(0)
+                        acquired = True
+                        waited = now - start
+                        _record_wait(state, model, waited)
+                        return waited
+                    # head of the queue: sleep exactly until there's capacity
+                    rpm, tpm = get_rate_limit(model)
+                    delay = max(
+                        (1 - bucket["requests"]) * 60 / rpm,
+                        (tokens - bucket["tokens"]) * 60 / tpm,
+                        RATE_LIMIT_POLL_INTERVAL,
+                    )
+            debug(f"Rate limited ({model}), waiting {delay:.2f}s")
+            time.sleep(min(delay, 1.0))
+    finally:
+        if not acquired:
+            with _locked_state() as state:
+                queue = state["queues"].get(model, [])
+                state["queues"][model] = [t for t in queue if t["id"] != ticket["id"]]
+
+
+def rate_limit_settle(model: str, reserved: int, used: int) -> None:
+    """
+    Return unused reserved tokens (or charge any overage) once actual usage is known.
+    :param model: (str) model name
+    :param reserved: (int) tokens passed to rate_limit_acquire
+    :param used: (int) total tokens reported by the API
+    :return: None
+    """
+    if reserved == used:
+        return
+    _, tpm = get_rate_limit(model)
+    with _locked_state() as state:
+        bucket = _refill(state, model, time.time())
+        bucket["tokens"] = min(float(tpm), bucket["tokens"] + reserved - used)
+
+
+def rate_limit_stats() -> dict:
+    """
+    Return per-model queueing statistics.
+    :return: (dict) model -> stats
+    """
+    with _locked_state() as state:
+        now = time.time()
+        stats = {}
+        for model in sorted(set(state["stats"]) | set(state["queues"])):
+            model_stats = dict(
+                state["stats"].get(
+                    model,
+                    {"requests": 0, "queued": 0, "total_wait": 0.0, "max_wait": 0.0},
+                )
+            )
+            model_stats["waiting"] = len(
+                _prune_queue(state["queues"].get(model, []), now)
+            )
+            model_stats["avg_wait"] = (
+                model_stats["total_wait"] / model_stats["requests"]
+                if model_stats["requests"]
+                else 0.0
+            )
+            stats[model] = model_stats
+        return stats
+
+
+def rate_limit_stats_print() -> None:
+    """
+    Print per-model queueing statistics.
+    :return: None
+    """
+    stats = rate_limit_stats()
+    if not stats:
+        info("No rate limit statistics yet.")
+        return
+    info(
+        f"{'model':<20} {'requests':>9} {'queued':>7} {'waiting':>8}"
+        f" {'avg wait':>9} {'max wait':>9}"
+    )
+    for model, s in stats.items():
+        info(
+            f"{model:<20} {s['requests']:>9} {s['queued']:>7} {s['waiting']:>8}"
+            f" {s['avg_wait']:>8.2f}s {s['max_wait']:>8.2f}s"
+        )
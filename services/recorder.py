@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+import openai
+
+from services.output import debug
+from utils.errors import RecordingNotFoundError
+
+"""
+Record/replay layer for chat completions.
+
+Install a Recorder as services.llm.completion_backend to route query_chatgpt
+through it. In replay mode (the default) responses come from recordings on disk
+and no request ever leaves the machine; in record mode every request goes to the
+API and its response is (re)recorded. Recordings are keyed by a hash of the
+model, messages and temperature, and keep the request's measured latency next to
+the API's usage so replays can report both.
+"""
+
+
+class Recorder:
+    def __init__(self, folder: str, record: bool = False):
+        """
+        :param folder: (str) folder holding the recordings
+        :param record: (bool) call the API and (re)record instead of replaying
+        """
+        self.folder = folder
+        self.record = record
+        # offline recorders never reach the API, so they skip rate limiting
+        self.offline = not record
+        # latency/usage of the last response, per thread (cases run in parallel)
+        self._last = threading.local()
+
+    @staticmethod
+    def recording_key(model: str, messages: list[dict], temperature: float) -> str:
+        payload = json.dumps(
+            {"model": model, "messages": messages, "temperature": temperature},
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def recording_path(self, **kwargs) -> str:
+        key = self.recording_key(
+            kwargs.get("model"), kwargs.get("messages"), kwargs.get("temperature")
+        )
+        return os.path.join(self.folder, f"{key}.json")
+
+    def last_stats(self) -> tuple[Optional[float], Optional[dict]]:
+        """
+        Recorded latency and API usage of the last response created on this thread.
+        :return: (tuple) latency in seconds and usage dict (either may be None)
+        """
+        return getattr(self._last, "latency", None), getattr(self._last, "usage", None)
+
+    def create(self, **kwargs):
+        """
+        Drop-in replacement for openai.ChatCompletion.create. Streamed requests are
+        recorded whole and replayed as a single chunk.
+        """
+        stream = kwargs.pop("stream", False)
+        path = self.recording_path(**kwargs)
+
+        if not self.record:
+            if not os.path.exists(path):
+                raise RecordingNotFoundError(path)
+            with open(path, "r") as f:
+                response = json.load(f)
+            latency = response.pop("latency", None)
+        else:
+            start = time.time()
+            response = openai.ChatCompletion.create(**kwargs)
+            latency = time.time() - start
+            os.makedirs(self.folder, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({**response, "latency": latency}, f, indent=2)
+            os.replace(tmp_path, path)
+            debug(f"Recorded {path}")
+
+        self._last.latency = latency
+        self._last.usage = response.get("usage")
+        if stream:
+            content = response["choices"][0]["message"]["content"]
+            return iter([{"choices": [{"delta": {"content": content}}]}])
+        return response
@@ -0,0 +1,59 @@
+import re
+
+from pygments import highlight
+
+from services.formatters.formatter import Formatter
+from services.renderers.renderer import LIST_ITEM_RE, QUOTE_RE, Renderer
+
+RESET = "\x1b[0m"
+BOLD = "\x1b[1m"
+DIM = "\x1b[2m"
+UNDERLINE = "\x1b[4m"
+RED = "\x1b[31m"
+GREEN = "\x1b[32m"
+YELLOW = "\x1b[33m"
+CYAN = "\x1b[36m"
+WHITE = "\x1b[37m"
+
+HEADING_RE = re.compile(r"^\s*(#{1,6})\s+(.*)$")
+INLINE_CODE_RE = re.compile(r"`([^`\n]+)`")
+STRONG_RE = re.compile(r"\*\*([^*\n]+)\*\*")
+LIST_MARKERS = frozenset("-*+0123456789")
+ROLE_COLORS = {"user": WHITE, "assistant": GREEN, "system": RED}
+
+
+class AnsiRenderer(Renderer):
+    """
+    Minimal ANSI renderer: markdown-lite prose styling (headings, lists, quotes,
+    inline code, bold) with plain escape codes; pygments only for code blocks.
+    """
+
+    def __init__(self, style: str, width: int = 0):
+        super().__init__(width=width)
+        self.formatter = Formatter.get_pygments_formatter(style)
+
+    def render_line(self, line: str) -> str:
+        # cheap membership tests first; most lines need no styling at all
+        start = line.lstrip()[:1]
+        if start == "#":
+            heading = HEADING_RE.match(line)
+            if heading:
+                return f"{BOLD}{UNDERLINE}{heading.group(2)}{RESET}"
+        elif start == ">":
+            line = QUOTE_RE.sub(lambda m: f"{DIM}{m.group(1)}{RESET}", line, 1)
+        elif start in LIST_MARKERS:
+            line = LIST_ITEM_RE.sub(lambda m: f"{YELLOW}{m.group(1)}{RESET}", line, 1)
+        if "`" in line:
+            line = INLINE_CODE_RE.sub(lambda m: f"{CYAN}{m.group(1)}{RESET}", line)
+        if "**" in line:
+            line = STRONG_RE.sub(lambda m: f"{BOLD}{m.group(1)}{RESET}", line)
+        return line
+
+    def render_role(self, role: str) -> str:
+        return f"{ROLE_COLORS.get(role, YELLOW)}{role}{RESET}"
+
+    def render_code(self, language: str, code: str, fenced: bool = True) -> str:
+        code = highlight(code, Formatter.get_lexer(language, code), self.formatter)
+        if not fenced:
+            return code
+        return f"{DIM}```{language}{RESET}\n{code}{DIM}```{RESET}"
@@ -0,0 +1,27 @@
+from pygments import highlight
+
+from services.formatters.default import DefaultFormatter
+from services.formatters.formatter import Formatter
+from services.renderers.renderer import Renderer
+
+
+class PygmentsRenderer(Renderer):
+    """
+    The original rendering path (DefaultFormatter): no prose styling or wrapping.
+    """
+
+    def __init__(self, style: str, width: int = 0):
+        super().__init__(width=width)
+        self.style = style
+        self.formatter = Formatter.get_pygments_formatter(style)
+
+    def render(self, content: str) -> str:
+        return DefaultFormatter().format(
+            content=content, enable_color=True, style=self.style
+        )
+
+    def render_code(self, language: str, code: str, fenced: bool = True) -> str:
+        code = highlight(code, Formatter.get_lexer(language, code), self.formatter)
+        if not fenced:
+            return code
+        return f"```{language}\n{code}```"
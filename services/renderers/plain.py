@@ -0,0 +1,12 @@
+from services.renderers.renderer import Renderer
+
+
+class PlainRenderer(Renderer):
+    """
+    No styling at all; prose is only wrapped and code blocks are left as-is.
+    """
+
+    def render_code(self, language: str, code: str, fenced: bool = True) -> str:
+        if not fenced:
+            return code
+        return f"```{language}\n{code}```"
@@ -0,0 +1,143 @@
+import re
+import textwrap
+from abc import ABC, abstractmethod
+
+CODE_BLOCK_RE = re.compile(r"```([^\n]*)\n((?:.|\n)*?)```")
+LIST_ITEM_RE = re.compile(r"^(\s*(?:[-*+]|\d+[.)])\s+)")
+QUOTE_RE = re.compile(r"^(\s*>\s?)")
+# inline spans that are styled as a unit, so they must not be wrapped across lines
+SPAN_RE = re.compile(r"`[^`\n]+`|\*\*[^*\n]+\*\*")
+# stands in for spaces inside spans while wrapping
+NO_BREAK_SPACE = "\x00"
+
+
+class Renderer(ABC):
+    """
+    Abstract base class for output renderers.
+
+    A renderer turns a (markdown-ish) response into terminal output. Prose and
+    fenced code blocks are rendered separately so that only code ever goes
+    through pygments.
+    """
+
+    def __init__(self, width: int = 0):
+        """
+        :param width: (int) wrap prose to this many columns (0 disables wrapping)
+        """
+        self.width = width
+
+    def render(self, content: str) -> str:
+        """
+        Render a response.
+        :param content: (str) raw response content
+        :return: (str) rendered content
+        """
+        content = content.strip()
+
+        # a response that is entirely one code block is rendered as bare code
+        match = CODE_BLOCK_RE.fullmatch(content)
+        if match:
+            return self.render_code(match.group(1), match.group(2), fenced=False)
+
+        chunks = []
+        position = 0
+        for match in CODE_BLOCK_RE.finditer(content):
+            chunks.append(self.render_prose(content[position: match.start()]))
+            chunks.append(self.render_code(match.group(1), match.group(2)))
+            position = match.end()
+        chunks.append(self.render_prose(content[position:]))
+        return "".join(chunks).strip()
+
+    def render_dialog(self, dialog: list[dict]) -> str:
+        """
+        Render a whole dialog (e.g. context history) as a single string.
+        :param dialog: (list) messages with role and content
+        :return: (str) rendered dialog
+        """
+        return "\n".join(
+            f"{self.render_role(message.get('role'))}: "
+            f"{self.render(message.get('content'))}"
+            for message in dialog
+        )
+
+    def wrap(self, line: str) -> list[str]:
+        """
+        Wrap a prose line to self.width, with hanging indents for lists and quotes.
+        :param line: (str) a single line of prose
+        :return: (list) wrapped lines
+        """
+        if not self.width or len(line) <= self.width:
+            return [line]
+        match = LIST_ITEM_RE.match(line)
+        if match:
+            indent = " " * len(match.group(1))
+        else:
+            match = QUOTE_RE.match(line)
+            indent = match.group(1) if match else ""
+        protected = "`" in line or "**" in line
+        if protected:
+            line = SPAN_RE.sub(
+                lambda m: m.group(0).replace(" ", NO_BREAK_SPACE), line
+            )
+        lines = textwrap.wrap(
+            line,
+            width=self.width,
+            subsequent_indent=indent,
+            break_long_words=False,
+            break_on_hyphens=False,
+        ) or [line]
+        if protected:
+            lines = [wrapped.replace(NO_BREAK_SPACE, " ") for wrapped in lines]
+        return lines
+
+    def render_prose(self, text: str) -> str:
+        """
+        Render prose (everything outside of code blocks).
+        """
+        return "\n".join(
+            self.render_line(wrapped)
+            for line in text.split("\n")
+            for wrapped in self.wrap(line)
+        )
+
+    def render_line(self, line: str) -> str:
+        """
+        Style a single (already wrapped) prose line.
+        """
+        return line
+
+    def render_role(self, role: str) -> str:
+        """
+        Style a dialog role label.
+        """
+        return role
+
+    @abstractmethod
+    def render_code(self, language: str, code: str, fenced: bool = True) -> str:
+        """
+        Render a fenced code block.
+        :param language: (str) fence language string (may be empty)
+        :param code: (str) code
+        :param fenced: (bool) keep the surrounding fences
+        """
+        pass
+
+
+def get_renderer(name: str, enable_color: bool, style: str, width: int = 0):
+    """
+    Return a renderer by name.
+    :param name: (str) 'ansi', 'plain' or 'pygments'
+    :param enable_color: (bool) color output (falls back to 'plain' if False)
+    :param style: (str) pygments style for code blocks
+    :param width: (int) wrap width (0 disables wrapping)
+    :return: Renderer
+    """
+    from services.renderers.ansi import AnsiRenderer
+    from services.renderers.plain import PlainRenderer
+    from services.renderers.legacy import PygmentsRenderer
+
+    if not enable_color or name == "plain":
+        return PlainRenderer(width=width)
+    if name == "pygments":
+        return PygmentsRenderer(style=style, width=width)
+    return AnsiRenderer(style=style, width=width)
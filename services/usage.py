@@ -0,0 +1,192 @@
+import csv
+import fcntl
+import io
+import os
+import time
+
+from config import (
+    APP_NAME,
+    OPENAI_PRICING,
+    USAGE_LEDGER_BACKUP_COUNT,
+    USAGE_LEDGER_MAX_BYTES,
+)
+from services.output import debug, info
+
+"""
+Append-only usage ledger.
+
+One CSV row per request:
+    timestamp, model, template, prompt_tokens, completion_tokens, latency_ms
+
+The ledger rotates to usage.csv.1 ... usage.csv.N once it grows past
+USAGE_LEDGER_MAX_BYTES. Reports stream over every file row by row, so memory use
+depends on the number of distinct (day, model, template) groups, not on rows.
+"""
+
+usage_folder = os.path.join(os.path.expanduser("~"), ".config", APP_NAME, "usage")
+usage_file = os.path.join(usage_folder, "usage.csv")
+lock_file = os.path.join(usage_folder, "usage.lock")
+
+
+def _rotate() -> None:
+    """
+    Rotate the ledger if it has outgrown USAGE_LEDGER_MAX_BYTES.
+    """
+    with open(lock_file, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            # another process may have rotated while we were waiting for the lock
+            if (
+                not os.path.exists(usage_file)
+                or os.path.getsize(usage_file) < USAGE_LEDGER_MAX_BYTES
+            ):
+                return
+            for i in range(USAGE_LEDGER_BACKUP_COUNT - 1, 0, -1):
+                if os.path.exists(f"{usage_file}.{i}"):
+                    os.replace(f"{usage_file}.{i}", f"{usage_file}.{i + 1}")
+            os.replace(usage_file, f"{usage_file}.1")
+            debug(f"Rotated usage ledger {usage_file}")
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def usage_record(
+    model: str,
+    template: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    latency: float,
+) -> None:
+    """
+    Append a usage record to the ledger.
+    :param model: (str) model name
+    :param template: (str) prompt template name ("" if none)
+    :param prompt_tokens: (int) prompt tokens reported by the API
+    :param completion_tokens: (int) completion tokens reported by the API
+    :param latency: (float) request latency in seconds
+    :return: None
+    """
+    if not os.path.exists(usage_folder):
+        os.makedirs(usage_folder, exist_ok=True)
+    if (
+        os.path.exists(usage_file)
+        and os.path.getsize(usage_file) >= USAGE_LEDGER_MAX_BYTES
+    ):
+        _rotate()
+    row = io.StringIO()
+    csv.writer(row, lineterminator="\n").writerow(
+        (
+            int(time.time()),
+            model,
+            template,
+            prompt_tokens,
+            completion_tokens,
+            int(latency * 1000),
+        )
+    )
+    # a single O_APPEND write keeps concurrent writers from interleaving rows
+    fd = os.open(usage_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, row.getvalue().encode())
+    finally:
+        os.close(fd)
+
+
+def usage_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """
+    Estimate the cost (USD) of a number of tokens.
+    :return: (float) cost, 0.0 if the model has no known pricing
+    """
+    prompt_price, completion_price = OPENAI_PRICING.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+def usage_files() -> list[str]:
+    """
+    Return ledger files, oldest first.
+    """
+    files = [
+        f"{usage_file}.{i}"
+        for i in range(USAGE_LEDGER_BACKUP_COUNT, 0, -1)
+        if os.path.exists(f"{usage_file}.{i}")
+    ]
+    if os.path.exists(usage_file):
+        files.append(usage_file)
+    return files
+
+
+def usage_aggregate() -> dict:
+    """
+    Stream the ledger and aggregate usage by day, model and template.
+    :return: (dict) {"day": {...}, "model": {...}, "template": {...}, "total": [...]}
+        where each value is [requests, prompt, completion, latency_ms, cost]
+    """
+    groups = {"day": {}, "model": {}, "template": {}}
+    total = [0, 0, 0, 0, 0.0]
+    days = {}  # local day lookup per 15 minutes (covers all tz offsets)
+
+    for path in usage_files():
+        with open(path, "r", newline="") as f:
+            for row in csv.reader(f):
+                try:
+                    timestamp, model, template = int(row[0]), row[1], row[2]
+                    prompt_tokens, completion_tokens = int(row[3]), int(row[4])
+                    latency_ms = int(row[5])
+                except (IndexError, ValueError):
+                    debug(f"Skipping malformed usage row in {path}: {row}")
+                    continue
+
+                bucket = timestamp // 900
+                day = days.get(bucket)
+                if day is None:
+                    day = days[bucket] = time.strftime(
+                        "%Y-%m-%d", time.localtime(timestamp)
+                    )
+                cost = usage_cost(model, prompt_tokens, completion_tokens)
+                values = (1, prompt_tokens, completion_tokens, latency_ms)
+
+                for group, key in (
+                    ("day", day),
+                    ("model", model),
+                    ("template", template or "-"),
+                ):
+                    agg = groups[group].get(key)
+                    if agg is None:
+                        agg = groups[group][key] = [0, 0, 0, 0, 0.0]
+                    for i, value in enumerate(values):
+                        agg[i] += value
+                    agg[4] += cost
+                for i, value in enumerate(values):
+                    total[i] += value
+                total[4] += cost
+
+    return {**groups, "total": total}
+
+
+def usage_print() -> None:
+    """
+    Print aggregated usage by day, model and template.
+    :return: None
+    """
+    usage = usage_aggregate()
+    if not usage["total"][0]:
+        info("No usage recorded yet.")
+        return
+
+    def _line(key, agg):
+        requests, prompt_tokens, completion_tokens, latency_ms, cost = agg
+        return (
+            f"{key:<20} {requests:>9} {prompt_tokens:>12} {completion_tokens:>12}"
+            f" {latency_ms / requests / 1000:>8.2f}s ${cost:>9.4f}"
+        )
+
+    header = (
+        f"{'requests':>9} {'prompt':>12} {'completion':>12}"
+        f" {'latency':>9} {'cost':>10}"
+    )
+    for group in ("day", "model", "template"):
+        info(f"{group:<20} {header}")
+        for key in sorted(usage[group]):
+            info(_line(key, usage[group][key]))
+        info("")
+    info(_line("total", usage["total"]))
@@ -8,9 +8,12 @@ from jinja2.exceptions import TemplateNotFound
 from services.output import exception, warning, error
 from config import DEBUG
 from utils.errors import (
+    CodeValidationError,
     PromptNotProvidedError,
     OpenAPIKeyNotFoundError,
     PromptTooLongError,
+    RateLimitTimeoutError,
+    TemplateTestError,
 )
 
 
@@ -20,6 +23,18 @@ def cli_error_handler(func):
     def wrapper(*args, **kwargs):
         try:
             return func(*args, **kwargs)
+        except TemplateTestError as e:
+            exception(e)
+            warning("Template tests failed.")
+            sys.exit(10)
+        except CodeValidationError as e:
+            exception(e)
+            warning("Code validation failed.")
+            sys.exit(9)
+        except RateLimitTimeoutError as e:
+            exception(e)
+            warning("Timed out waiting for rate limit capacity.")
+            sys.exit(8)
         except PromptTooLongError as e:
             exception(e)
             warning("Prompt too long.")
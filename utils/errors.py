@@ -8,3 +8,23 @@ class OpenAPIKeyNotFoundError(Exception):
 
 class PromptTooLongError(Exception):
     pass
+
+
+class RateLimitTimeoutError(Exception):
+    pass
+
+
+class CodeValidationError(Exception):
+    pass
+
+
+class RecordingNotFoundError(Exception):
+    pass
+
+
+class TemplateTestError(Exception):
+    pass
+
+
+class ContextFormatError(Exception):
+    pass